@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""查询微批处理的吞吐量/延迟基准测试
+
+默认使用模拟编码器（固定开销 + 每条开销）以便在无模型环境下运行；
+加 --model 参数时使用真实的 bge 模型。
+
+    python bench_embedding_batcher.py --clients 16 --requests 20 --windows 0 2 5 10
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+from embedding_batcher import EmbeddingBatcher
+
+
+def make_synthetic_encoder(base_ms, per_item_ms, dim=1024):
+    # 模拟一次前向计算：固定开销 + 与批大小成正比的开销
+    lock = threading.Lock()  # CPU 上同一时间只跑一次前向计算
+
+    def encode(texts):
+        with lock:
+            time.sleep((base_ms + per_item_ms * len(texts)) / 1000.0)
+        return [[0.0] * dim for _ in texts]
+    return encode
+
+
+def percentile(values, p):
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[idx]
+
+
+def run_threads(embed, clients, requests):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(cid):
+        for i in range(requests):
+            start = time.perf_counter()
+            embed(f"超声换能器的工作原理 {cid}-{i}")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies
+
+
+def run_asyncio(aembed, clients, requests):
+    latencies = []
+
+    async def worker(cid):
+        for i in range(requests):
+            start = time.perf_counter()
+            await aembed(f"超声换能器的工作原理 {cid}-{i}")
+            latencies.append(time.perf_counter() - start)
+
+    async def runner():
+        await asyncio.gather(*(worker(c) for c in range(clients)))
+
+    start = time.perf_counter()
+    asyncio.run(runner())
+    return time.perf_counter() - start, latencies
+
+
+def report(label, elapsed, latencies, extra=""):
+    total = len(latencies)
+    print(f"{label:<18} 吞吐 {total / elapsed:8.1f} q/s  "
+          f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+          f"p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+          f"mean {statistics.mean(latencies) * 1000:7.1f} ms {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询微批处理基准测试")
+    parser.add_argument("--clients", type=int, default=16, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=20, help="每个客户端的请求数")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 2, 5, 10], help="批处理窗口(ms)")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--base-ms", type=float, default=20.0, help="模拟编码器的固定开销")
+    parser.add_argument("--per-item-ms", type=float, default=1.5, help="模拟编码器的每条开销")
+    parser.add_argument("--asyncio", action="store_true", help="使用 asyncio 客户端代替线程")
+    parser.add_argument("--model", default=None, help="使用真实模型，例如 bge-large-zh-v1.5")
+    args = parser.parse_args()
+
+    if args.model:
+        from rag_system import SentenceTransformerEmbeddings
+        encode = SentenceTransformerEmbeddings(args.model).embed_queries
+    else:
+        encode = make_synthetic_encoder(args.base_ms, args.per_item_ms)
+
+    print(f"并发 {args.clients} x {args.requests} 次请求, 模式: {'asyncio' if args.asyncio else 'threads'}")
+
+    # 基线：每条查询单独编码
+    elapsed, latencies = run_threads(lambda t: encode([t])[0], args.clients, args.requests)
+    report("无批处理", elapsed, latencies)
+
+    for window in args.windows:
+        batcher = EmbeddingBatcher(encode, max_wait_ms=window, max_batch_size=args.max_batch)
+        if args.asyncio:
+            elapsed, latencies = run_asyncio(batcher.aembed, args.clients, args.requests)
+        else:
+            elapsed, latencies = run_threads(batcher.embed, args.clients, args.requests)
+        avg_batch = batcher.stats["requests"] / max(1, batcher.stats["batches"])
+        report(f"窗口 {window:g} ms", elapsed, latencies, f"平均批大小 {avg_batch:.1f}")
+        batcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""按 token 数切分文本块
+
+使用 bge 模型自带的分词器计数，按中文句子边界切分，块大小在目标值附近且不超过上限，
+相邻块之间保留少量重叠句子。
+
+对比当前的 merge_segments 切分：
+    python chunker.py [--docx 文件 ...] [--eval questions.jsonl]
+questions.jsonl 每行 {"question": ..., "expected": 应出现在检索结果中的关键词}
+"""
+import argparse
+import json
+import os
+import pickle
+import re
+import time
+from typing import Dict, List, Tuple
+
+try:
+    from .context_assembler import estimate_tokens
+except ImportError:
+    from context_assembler import estimate_tokens
+
+MODEL_MAX_TOKENS = 512  # bge-large-zh 的最大输入长度(含 [CLS]/[SEP])
+_SENTENCE_END = re.compile(r'(?<=[。！？；!?;])|\n')
+
+
+def split_sentences(text):
+    """按中文句末标点和换行切分句子, 保留标点"""
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+class TokenChunker:
+    def __init__(self, model_name="bge-large-zh-v1.5", target_tokens=200, max_tokens=480, overlap_tokens=40):
+        self.target_tokens = target_tokens
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.tokenizer = self._load_tokenizer(model_name)
+
+    @staticmethod
+    def _load_tokenizer(model_name):
+        model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model", model_name)
+        try:
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+        except Exception as e:
+            print(f"加载分词器失败, 使用估算 token 数: {e}")
+            return None
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """批量计算 token 数, 一次调用处理整个语料"""
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [estimate_tokens(t) for t in texts]
+        encoded = self.tokenizer(texts, add_special_tokens=False, return_attention_mask=False,
+                                 return_token_type_ids=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _split_long(self, sentence, tokens):
+        # 单句超过上限时按字符比例硬切分
+        pieces = -(-tokens // self.max_tokens)
+        size = -(-len(sentence) // pieces)
+        return [sentence[i:i + size] for i in range(0, len(sentence), size)]
+
+    def chunk_documents(self, documents: List[str], sections: List[str] = None) -> Tuple[List[str], List[Dict]]:
+        """切分整个语料, 返回文本块及其元数据(包含覆盖的全部段落号)
+
+        传入与 documents 等长的 sections 时, 文本块不会跨越章节边界。
+        """
+        sentences, owners = [], []
+        for doc_idx, doc in enumerate(documents):
+            for sentence in split_sentences(doc):
+                sentences.append(sentence)
+                owners.append(doc_idx)
+        counts = self.count_tokens(sentences)
+
+        # 过长的句子先切开, 切分后的片段统一再计数一次
+        split = {i: self._split_long(sentences[i], count)
+                 for i, count in enumerate(counts) if count > self.max_tokens}
+        piece_counts = iter(self.count_tokens([p for i in split for p in split[i]]))
+        units = []
+        for i, (sentence, owner, count) in enumerate(zip(sentences, owners, counts)):
+            if i in split:
+                units.extend((piece, owner, next(piece_counts)) for piece in split[i])
+            else:
+                units.append((sentence, owner, count))
+
+        chunks, metadata = [], []
+        current, current_tokens = [], 0
+
+        def flush():
+            doc_ids = sorted(set(owner for _, owner, _ in current))
+            chunks.append("".join(text for text, _, _ in current))
+            meta = {
+                "original_doc_idx": doc_ids[0],
+                "paragraph_number": doc_ids[0] + 1,
+                "paragraph_numbers": [i + 1 for i in doc_ids],
+            }
+            if sections:
+                meta["section"] = sections[doc_ids[0]]
+            metadata.append(meta)
+
+        for unit in units:
+            _, owner, count = unit
+            if current and sections and sections[current[-1][1]] != sections[owner]:
+                # 章节变化时结束当前块, 且不保留重叠
+                flush()
+                current, current_tokens = [], 0
+            elif current and (current_tokens >= self.target_tokens or current_tokens + count > self.max_tokens):
+                flush()
+                # 保留末尾若干句作为重叠
+                overlap, overlap_tokens = [], 0
+                for prev in reversed(current):
+                    if overlap_tokens + prev[2] > self.overlap_tokens:
+                        break
+                    overlap.insert(0, prev)
+                    overlap_tokens += prev[2]
+                if overlap_tokens + count > self.max_tokens:
+                    overlap, overlap_tokens = [], 0
+                current, current_tokens = overlap, overlap_tokens
+            current.append(unit)
+            current_tokens += count
+        if current:
+            flush()
+        return chunks, metadata
+
+
+# -------- 统计与对比 --------
+def chunk_stats(token_counts: List[int], embedding_dim=1024) -> Dict[str, float]:
+    ordered = sorted(token_counts)
+    n = len(ordered)
+    return {
+        "chunks": n,
+        "mean_tokens": sum(ordered) / n if n else 0,
+        "p50_tokens": ordered[n // 2] if n else 0,
+        "p95_tokens": ordered[min(n - 1, int(n * 0.95))] if n else 0,
+        "max_tokens": ordered[-1] if n else 0,
+        "truncated": sum(1 for c in ordered if c + 2 > MODEL_MAX_TOKENS),
+        "index_bytes": n * embedding_dim * 4,
+    }
+
+
+def retrieval_hit_rate(chunks, metadata, questions, embedder, k=4):
+    """在临时索引上计算 hit@k: 检索结果中出现期望关键词的问题比例"""
+    from langchain_community.vectorstores import FAISS
+    store = FAISS.from_texts(chunks, embedder, metadatas=metadata)
+    hits = 0
+    for item in questions:
+        docs = store.similarity_search(item["question"], k=k)
+        if any(item["expected"] in doc.page_content for doc in docs):
+            hits += 1
+    return hits / len(questions) if questions else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 merge_segments 与 token 切分")
+    parser.add_argument("--docx", nargs="*", help="原始 DOCX 文件；默认读取 documents.pkl")
+    parser.add_argument("--eval", help="检索质量评估问题集(JSONL)")
+    parser.add_argument("--target", type=int, default=200)
+    parser.add_argument("--max", type=int, default=480)
+    parser.add_argument("--overlap", type=int, default=40)
+    parser.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+
+    from rag_system import RAGSystem, merge_segments, clean_text
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    rag = None
+    if args.docx:
+        rag = RAGSystem()
+        rag.process_file(args.docx, min_paragraph_length=5)
+        documents = rag.documents
+    else:
+        with open(os.path.join(base_dir, "documents.pkl"), "rb") as f:
+            documents = pickle.load(f)
+    documents = [clean_text(doc) for doc in documents]
+
+    chunker = TokenChunker(target_tokens=args.target, max_tokens=args.max, overlap_tokens=args.overlap)
+
+    start = time.perf_counter()
+    old_chunks, old_meta = [], []
+    for doc_idx, doc in enumerate(documents):
+        segments = merge_segments(doc)
+        old_chunks.extend(segments)
+        old_meta.extend([{"original_doc_idx": doc_idx, "paragraph_number": doc_idx + 1}] * len(segments))
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new_chunks, new_meta = chunker.chunk_documents(documents)
+    new_time = time.perf_counter() - start
+
+    old_stats = chunk_stats(chunker.count_tokens(old_chunks))
+    new_stats = chunk_stats(chunker.count_tokens(new_chunks))
+    print(f"{'指标':<14}{'merge_segments':>16}{'token 切分':>16}")
+    for key in old_stats:
+        print(f"{key:<16}{old_stats[key]:>16.1f}{new_stats[key]:>16.1f}")
+    print(f"{'耗时(s)':<14}{old_time:>16.3f}{new_time:>16.3f}")
+
+    if args.eval:
+        with open(args.eval, "r", encoding="utf-8") as f:
+            questions = [json.loads(line) for line in f if line.strip()]
+        rag = rag or RAGSystem()
+        old_hit = retrieval_hit_rate(old_chunks, old_meta, questions, rag.embedder, k=args.k)
+        new_hit = retrieval_hit_rate(new_chunks, new_meta, questions, rag.embedder, k=args.k)
+        print(f"hit@{args.k:<12}{old_hit:>16.3f}{new_hit:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import math
+import re
+from typing import Any, Dict, List, Tuple
+
+_CJK = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+# -------- token 估算 --------
+def estimate_tokens(text):
+    """快速估算 token 数: 中文字符及全角标点约 1 token, 其余字符约 4 个 1 token"""
+    cjk = len(_CJK.findall(text))
+    other = len(re.sub(r'\s+', '', _CJK.sub('', text)))
+    return cjk + math.ceil(other / 4)
+
+def char_shingles(text, n=3):
+    """去掉空白后的字符 n-gram 集合"""
+    text = re.sub(r'\s+', '', text)
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def jaccard(a, b):
+    """两个 n-gram 集合的 Jaccard 相似度"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+MIN_OVERLAP = 10  # 首尾重叠至少这么多字符才视为重叠, 避免偶然相同的字符被合并
+SENTENCE_END = "。！？；!?;\n"
+
+def _is_overlap(merged, text, size):
+    if not merged.endswith(text[:size]):
+        return False
+    if size >= MIN_OVERLAP:
+        return True
+    # 较短的重叠须是完整的句子: 在前一片段中从句首开始, 并以句末标点结束
+    starts_sentence = size == len(merged) or merged[-size - 1] in SENTENCE_END
+    return starts_sentence and text[size - 1] in SENTENCE_END
+
+def _join_texts(texts):
+    # 按段落顺序拼接, 去掉相邻片段之间的包含或首尾重叠部分
+    merged = texts[0]
+    for text in texts[1:]:
+        if text in merged:
+            continue
+        if merged in text:
+            merged = text
+            continue
+        overlap = 0
+        for size in range(min(len(merged), len(text)) - 1, 0, -1):
+            if _is_overlap(merged, text, size):
+                overlap = size
+                break
+        if overlap:
+            merged += text[overlap:]
+        else:
+            merged += "\n" + text
+    return merged
+
+def _truncate_to_budget(text, budget):
+    # 按估算比例截断, 再逐步收缩直到满足预算
+    if budget <= 0:
+        return ""
+    end = max(1, int(len(text) * budget / max(1, estimate_tokens(text))))
+    while end > 0 and estimate_tokens(text[:end]) > budget:
+        end -= max(1, end // 20)
+    return text[:max(0, end)]
+
+# -------- 上下文组装 --------
+def assemble_context(hits: List[Tuple[Any, float]], token_budget=1500, dedup_threshold=0.85) -> Dict[str, Any]:
+    """将检索结果组装为受 token 预算限制的上下文
+
+    Args:
+        hits: similarity_search_with_score 的结果, [(Document, 距离)], 距离越小越相关
+        token_budget: 上下文允许的最大 token 数(估算值)
+        dedup_threshold: 3-gram Jaccard 相似度超过该值的片段视为重复
+
+    Returns:
+        {"segments": [{"paragraphs", "duplicate_paragraphs", "text", "score", "tokens"}], "tokens": 总数,
+         "dropped": 丢弃的片段数}
+        duplicate_paragraphs 为建索引时去除的近似重复副本所在的段落, 只用于查找图片, 不参与相邻合并
+    """
+    hits = sorted(hits, key=lambda item: item[1])
+
+    # 1. 去除近似重复的片段, 保留得分最好的一条
+    kept, kept_shingles, dropped = [], [], 0
+    for doc, score in hits:
+        shingles = char_shingles(doc.page_content)
+        if any(jaccard(shingles, other) >= dedup_threshold for other in kept_shingles):
+            dropped += 1
+            continue
+        kept.append((doc, score))
+        kept_shingles.append(shingles)
+
+    # 2. 合并相邻或相同段落的命中
+    groups = []
+    for doc, score in kept:
+        # token 切分的文本块可能跨越多个段落
+        numbers = [p for p in doc.metadata.get('paragraph_numbers', [doc.metadata.get('paragraph_number')])
+                   if isinstance(p, int)]
+        duplicates = doc.metadata.get('duplicate_paragraphs', [])
+        first = min(numbers) if numbers else 0
+        target = None
+        for group in groups:
+            if any(abs(p - q) <= 1 for p in group["paragraphs"] for q in numbers):
+                target = group
+                break
+        if target is None:
+            groups.append({"paragraphs": list(numbers), "duplicates": list(duplicates),
+                           "hits": [(first, doc.page_content)], "score": score})
+        else:
+            target["paragraphs"].extend(numbers)
+            target["duplicates"].extend(duplicates)
+            target["hits"].append((first, doc.page_content))
+            target["score"] = min(target["score"], score)
+
+    segments = []
+    for group in groups:
+        ordered = sorted(group["hits"], key=lambda item: item[0])
+        text = _join_texts([content for _, content in ordered])
+        paragraphs = sorted(set(group["paragraphs"]))
+        duplicates = sorted(set(group["duplicates"]) - set(paragraphs))
+        segments.append({"paragraphs": paragraphs, "duplicate_paragraphs": duplicates, "text": text, "score": float(group["score"]),
+                         "tokens": estimate_tokens(text)})
+
+    # 3. 按相关度依次填充, 直到达到 token 预算
+    segments.sort(key=lambda seg: seg["score"])
+    selected, used = [], 0
+    for seg in segments:
+        if used + seg["tokens"] <= token_budget:
+            selected.append(seg)
+            used += seg["tokens"]
+        elif not selected:
+            # 最相关的片段本身超出预算时截断保留
+            seg["text"] = _truncate_to_budget(seg["text"], token_budget)
+            seg["tokens"] = estimate_tokens(seg["text"])
+            selected.append(seg)
+            used += seg["tokens"]
+        else:
+            dropped += 1
+    return {"segments": selected, "tokens": used, "dropped": dropped}
+
+def format_context(context: Dict[str, Any]) -> str:
+    """将结构化上下文渲染为提示词中的参考资料"""
+    lines = []
+    for seg in context["segments"]:
+        paragraphs = seg["paragraphs"]
+        if not paragraphs:
+            label = "未知"
+        elif len(paragraphs) == 1:
+            label = str(paragraphs[0])
+        else:
+            label = f"{paragraphs[0]}-{paragraphs[-1]}"
+        lines.append(f"段落 {label}: {seg['text']}")
+    return "\n".join(lines)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""多语料集合管理
+
+每个集合是一个独立目录, 包含 vector_store.faiss、documents.pkl 和 Pictures(含图片清单):
+    RAG/                       默认集合 "default"(原有的教材)
+    RAG/corpora/<名称>/         其他教材、指南等
+
+集合在第一次使用时加载, 已加载的集合按 LRU 保存在内存中, 总内存超出上限时淘汰最久未用的集合。
+所有集合共用同一个嵌入模型。开启空闲淘汰后, 长时间没有查询的集合和嵌入模型会被卸载, 下次查询时重新加载。
+多进程部署时索引任务只在一个工作进程中热替换, 其他进程在下次查询时发现索引文件已更新并重新加载。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+try:
+    from .context_assembler import assemble_context
+except ImportError:
+    from context_assembler import assemble_context
+
+DEFAULT_COLLECTION = "default"
+
+
+def estimate_memory(rag) -> int:
+    """估算一个集合常驻内存的字节数(向量 + 文本), 不含共用的嵌入模型"""
+    size = 0
+    store = rag.vector_store
+    if store is not None:
+        # 内存映射的索引由页缓存按需换入, 不计入
+        if not getattr(rag, "mmap_index", False):
+            size += store.index.ntotal * store.index.d * 4
+        reduced = getattr(rag, "reduced_index", None)
+        if reduced is not None and rag.reduced_search:
+            size += reduced.memory_bytes()
+        size += sum(len(doc.page_content.encode("utf-8")) for doc in store.docstore._dict.values())
+    size += sum(len(doc.encode("utf-8")) for doc in rag.documents)
+    return size
+
+
+def process_rss() -> int:
+    """当前进程的常驻内存字节数"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        # 非 Linux 上只能取得峰值
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+
+class CollectionManager:
+    """
+    Args:
+        rag_factory: 根据 (集合目录, 共用嵌入器) 创建 RAGSystem 的函数
+        embedder: 所有集合共用的嵌入器
+        base_dir: 默认集合所在目录, 其他集合位于 base_dir/corpora 下
+        memory_limit_mb: 已加载集合的总内存上限
+        max_workers: 多集合并行检索的线程数
+    """
+
+    def __init__(self, rag_factory: Callable, embedder, base_dir: str, memory_limit_mb=2048, max_workers=4):
+        self.rag_factory = rag_factory
+        self.embedder = embedder
+        self.base_dir = base_dir
+        self.collections_dir = os.path.join(base_dir, "corpora")
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self._cache = OrderedDict()  # 名称 -> (RAGSystem, 估算字节数)
+        self._stamps: Dict[str, Any] = {}  # 名称 -> 加载时索引文件的修改时间
+        self._last_used: Dict[str, float] = {}
+        self._evictor = None
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-collection")
+        self.stats = {"loads": 0, "evictions": 0, "idle_evictions": 0, "model_unloads": 0}
+        self.max_workers = max_workers
+        if hasattr(os, "register_at_fork"):  # Windows 不支持 fork
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # 已加载的集合保留(与父进程共享内存页), 锁、线程池和空闲卸载线程在子进程中重建
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rag-collection")
+        if self._evictor is not None:
+            self._evictor = None
+            self.start_idle_eviction(self.idle_timeout)
+
+    def collection_dir(self, name: str) -> str:
+        if name == DEFAULT_COLLECTION:
+            return self.base_dir
+        if os.path.basename(name) != name or name.startswith("."):
+            raise ValueError(f"非法的集合名称: {name}")
+        return os.path.join(self.collections_dir, name)
+
+    def list_collections(self) -> List[str]:
+        names = [DEFAULT_COLLECTION]
+        if os.path.isdir(self.collections_dir):
+            for name in sorted(os.listdir(self.collections_dir)):
+                # 以 . 开头的是构建中的临时目录
+                if not name.startswith(".") and os.path.isdir(os.path.join(self.collections_dir, name, "vector_store.faiss")):
+                    names.append(name)
+        return names
+
+    def _index_stamp(self, name: str):
+        try:
+            return os.stat(os.path.join(self.collection_dir(name), "vector_store.faiss", "index.faiss")).st_mtime_ns
+        except OSError:
+            return None
+
+    def _is_stale(self, name: str) -> bool:
+        # 调用方需持有锁; 替换过程中索引文件短暂缺失时继续使用已加载的版本
+        stamp = self._index_stamp(name)
+        return stamp is not None and stamp != self._stamps.get(name)
+
+    def unknown_collections(self, names: List[str]) -> List[str]:
+        """返回不存在(尚未建立索引)的集合名称"""
+        available = set(self.list_collections())
+        return [name for name in names if name not in available]
+
+    def get(self, name: str = DEFAULT_COLLECTION):
+        """返回已加载的集合, 未加载时在第一次使用时加载; 集合不存在时抛出 KeyError"""
+        with self._lock:
+            self._last_used[name] = time.monotonic()
+            if name in self._cache and self._is_stale(name):
+                # 其他进程已重建该集合的索引
+                del self._cache[name]
+            if name in self._cache:
+                self._cache.move_to_end(name)
+                return self._cache[name][0]
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        # 不为不存在的名称创建目录和空的 RAGSystem
+        if self.unknown_collections([name]):
+            raise KeyError(f"集合不存在: {name}")
+
+        # 同一集合只加载一次, 不同集合可以并行加载
+        with load_lock:
+            with self._lock:
+                if name in self._cache:
+                    self._cache.move_to_end(name)
+                    return self._cache[name][0]
+            stamp = self._index_stamp(name)
+            rag = self.rag_factory(self.collection_dir(name), self.embedder)
+            size = estimate_memory(rag)
+            with self._lock:
+                self._cache[name] = (rag, size)
+                self._stamps[name] = stamp
+                self.stats["loads"] += 1
+                self._evict(keep=name)
+            return rag
+
+    def put(self, name: str, rag):
+        """替换已加载的集合(例如重建索引后)"""
+        with self._lock:
+            self._cache[name] = (rag, estimate_memory(rag))
+            self._stamps[name] = self._index_stamp(name)
+            self._cache.move_to_end(name)
+            self._evict(keep=name)
+
+    def _evict(self, keep: str):
+        # 调用方需持有锁; 刚使用的集合即使单独超限也保留
+        total = sum(size for _, size in self._cache.values())
+        while total > self.memory_limit and len(self._cache) > 1:
+            name, (_, size) = next(iter(self._cache.items()))
+            if name == keep:
+                break
+            del self._cache[name]
+            total -= size
+            self.stats["evictions"] += 1
+            print(f"内存超出上限, 卸载集合 {name}")
+
+    def preload(self, names: List[str] = None):
+        """加载集合和嵌入模型但不启动任何线程, 用于多进程部署时在主进程 fork 前预加载"""
+        for name in names or [DEFAULT_COLLECTION]:
+            self.get(name)
+        base = self._base_embedder()
+        if hasattr(base, "model"):
+            base.model
+
+    def _base_embedder(self):
+        # 共用嵌入器可能被 BatchedEmbeddings 包装
+        return getattr(self.embedder, "embedder", self.embedder)
+
+    def start_idle_eviction(self, idle_timeout: float, interval: float = None):
+        """启动后台线程, 卸载超过 idle_timeout 秒未使用的集合和嵌入模型"""
+        self.idle_timeout = idle_timeout
+        interval = interval or max(1.0, idle_timeout / 4)
+        if self._evictor is None or not self._evictor.is_alive():
+            self._evictor = threading.Thread(target=self._evict_idle_loop, args=(interval,),
+                                             name="rag-idle-evictor", daemon=True)
+            self._evictor.start()
+
+    def _evict_idle_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.evict_idle(self.idle_timeout)
+            except Exception as e:
+                print(f"空闲卸载失败: {e}")
+
+    def evict_idle(self, idle_timeout: float):
+        now = time.monotonic()
+        with self._lock:
+            for name in list(self._cache):
+                if now - self._last_used.get(name, 0) > idle_timeout:
+                    # 正在查询的请求持有 RAGSystem 引用, 不受影响
+                    del self._cache[name]
+                    self.stats["idle_evictions"] += 1
+                    print(f"集合 {name} 空闲超过 {idle_timeout}s, 已卸载")
+
+        base = self._base_embedder()
+        if hasattr(base, "unload") and base.is_loaded() and now - base.last_used > idle_timeout:
+            base.unload()
+            self.stats["model_unloads"] += 1
+            print(f"嵌入模型空闲超过 {idle_timeout}s, 已卸载")
+
+    def memory_status(self) -> Dict[str, Any]:
+        """进程内存、嵌入模型和各集合的内存占用"""
+        now = time.monotonic()
+        base = self._base_embedder()
+        model_loaded = base.is_loaded() if hasattr(base, "is_loaded") else True
+        with self._lock:
+            cache = list(self._cache.items())
+            last_used = dict(self._last_used)
+        collections = {}
+        for name, (rag, size) in cache:
+            collections[name] = {
+                "bytes": size,
+                "mmap_index": getattr(rag, "mmap_index", False),
+                "documents": len(rag.documents),
+                "idle_seconds": now - last_used.get(name, now),
+            }
+        return {
+            "rss_bytes": process_rss(),
+            "idle_timeout": getattr(self, "idle_timeout", None),
+            "model": {
+                "loaded": model_loaded,
+                "bytes": base.memory_bytes() if hasattr(base, "memory_bytes") else None,
+                "idle_seconds": now - base.last_used if hasattr(base, "last_used") else None,
+            },
+            "collections": collections,
+        }
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = {name: size for name, (_, size) in self._cache.items()}
+        return dict(self.stats, loaded=loaded, memory_bytes=sum(loaded.values()), memory_limit=self.memory_limit)
+
+    def query_context(self, question: str, collections: List[str], k=4, token_budget=1500, sections=None):
+        """在多个集合中并行检索, 按得分合并后组装上下文; 跳过不存在的集合"""
+        unknown = self.unknown_collections(collections)
+        if unknown:
+            print(f"跳过不存在的集合: {', '.join(unknown)}")
+            collections = [name for name in collections if name not in unknown]
+        query_vector = self.embedder.embed_query(question)
+
+        def search(name):
+            rag = self.get(name)
+            return name, rag, rag.search_by_vector(query_vector, k=k, sections=sections)
+
+        results = list(self._executor.map(search, collections))
+
+        # 全局取得分最好的 k 条, 再在各集合内合并相邻段落(段落号只在集合内有意义)
+        tagged = [(score, name, doc) for name, _, hits in results for doc, score in hits]
+        tagged.sort(key=lambda item: item[0])
+        top = tagged[:k]
+        segments, dropped = [], 0
+        for name, rag, _ in results:
+            hits = [(doc, score) for score, owner, doc in top if owner == name]
+            if not hits:
+                continue
+            context = assemble_context(hits, token_budget)
+            dropped += context["dropped"]
+            for seg in context["segments"]:
+                seg["collection"] = name
+                segments.append((seg, rag))
+
+        segments.sort(key=lambda item: item[0]["score"])
+        selected, images, seen_images, used = [], [], set(), 0
+        for seg, rag in segments:
+            if selected and used + seg["tokens"] > token_budget:
+                dropped += 1
+                continue
+            selected.append(seg)
+            used += seg["tokens"]
+            for paragraph_number in seg["paragraphs"] + seg.get("duplicate_paragraphs", []):
+                images.extend(rag.find_images(paragraph_number, seen_images))
+        return {"segments": selected, "tokens": used, "dropped": dropped, "question": question, "images": images}
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+from langchain.embeddings.base import Embeddings
+
+# -------- 查询向量微批处理 --------
+class EmbeddingBatcher:
+    """将短时间窗口内并发到达的查询合并为一次批量编码
+
+    Args:
+        encode_fn: 批量编码函数，输入文本列表，返回等长的向量列表
+        max_wait_ms: 从第一条查询到达起最多等待的毫秒数
+        max_batch_size: 单批最多包含的查询数，达到后立即编码
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], List[List[float]]], max_wait_ms=5, max_batch_size=32):
+        self.encode_fn = encode_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._pending = []  # 元素为 (text, future, 到达时间)
+        self._cond = threading.Condition()
+        self._worker = None
+        self._closed = False
+        self.stats = {"requests": 0, "batches": 0, "max_batch": 0}
+        if hasattr(os, "register_at_fork"):  # Windows 不支持 fork
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # 子进程中没有父进程的工作线程, 锁可能处于被持有状态, 全部重建; 工作线程在下次提交时启动
+        self._pending = []
+        self._cond = threading.Condition()
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """提交一条查询，返回在批量编码完成后得到结果的 Future"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("批处理器已关闭")
+            self._ensure_worker()
+            self._pending.append((text, future, time.monotonic()))
+            self.stats["requests"] += 1
+            self._cond.notify()
+        return future
+
+    def embed(self, text: str) -> List[float]:
+        """线程中同步调用"""
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> List[float]:
+        """asyncio 中调用，不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            # 窗口从本批第一条查询到达时开始计时
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # 跳过调用方已取消的请求
+            batch = [(text, future) for text, future, _ in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            with self._cond:
+                self.stats["batches"] += 1
+                self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            try:
+                vectors = self.encode_fn([text for text, _ in batch])
+                if len(vectors) != len(batch):
+                    raise RuntimeError(f"编码函数返回 {len(vectors)} 个向量, 预期 {len(batch)} 个")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+class BatchedEmbeddings(Embeddings):
+    """在 SentenceTransformerEmbeddings 前加一层批处理器，可直接交给 FAISS 使用"""
+
+    def __init__(self, embedder, max_wait_ms=5, max_batch_size=32):
+        self.embedder = embedder
+        self.batcher = EmbeddingBatcher(embedder.embed_queries, max_wait_ms, max_batch_size)
+
+    def embed_documents(self, texts):
+        return self.embedder.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.batcher.embed(text)
+
+    async def aembed_query(self, text):
+        return await self.batcher.aembed(text)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""按内容哈希存储的图片库
+
+目录结构（root 默认为 RAG/Pictures）：
+    blobs/ab/abcdef....png            原图（无损，只存一份）
+    blobs/ab/abcdef....thumb.webp     缩略图
+    blobs/ab/abcdef....display.jpg    网页展示尺寸
+    manifest.json                      段落位置 -> 图片哈希
+
+迁移旧目录：
+    python image_store.py migrate [--pictures DIR] [--remove-originals]
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+THUMB_SIZE = (256, 256)
+DISPLAY_SIZE = (1024, 1024)
+LEGACY_NAME = re.compile(r"^paragraph_(\d+|unassigned)_image_(\d+)\.png$")
+
+
+def content_hash(image: Image.Image) -> str:
+    """按像素内容计算哈希，编码方式不同但内容相同的图片得到相同的键"""
+    h = hashlib.sha256()
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    h.update(image.tobytes())
+    # P/PA 模式的像素只是调色板索引, 调色板和透明色不同则内容不同
+    palette = image.getpalette()
+    if palette is not None:
+        h.update(b"palette:" + bytes(palette))
+        h.update(f"transparency:{image.info.get('transparency')!r}".encode())
+    return h.hexdigest()[:32]
+
+
+class ImageStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.manifest_path = os.path.join(root, "manifest.json")
+        # images: 哈希 -> [宽, 高, 原图字节数]；positions: 段落位置 -> 哈希列表
+        self.images: Dict[str, List[int]] = {}
+        self.positions: Dict[str, List[str]] = {}
+        self.load()
+
+    def exists(self) -> bool:
+        return bool(self.images)
+
+    def load(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.images = manifest.get("images", {})
+            self.positions = manifest.get("positions", {})
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "images": self.images, "positions": self.positions},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.manifest_path)
+
+    def clear_positions(self):
+        # 重新解析文档前清空位置映射，图片文件本身保留以便复用
+        self.positions = {}
+
+    # -------- 路径 --------
+    def _blob_base(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def original_path(self, digest: str) -> str:
+        return self._blob_base(digest) + ".png"
+
+    def thumb_path(self, digest: str) -> str:
+        return self._blob_base(digest) + ".thumb.webp"
+
+    def display_path(self, digest: str) -> str:
+        return self._blob_base(digest) + ".display.jpg"
+
+    # -------- 写入 --------
+    def put(self, data: bytes, position: int) -> Optional[str]:
+        """写入一张图片并记录所在段落位置，返回内容哈希；内容已存在时只追加位置"""
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        digest = content_hash(image)
+        if digest not in self.images:
+            self._write_blob(digest, image)
+        hashes = self.positions.setdefault(str(position), [])
+        if digest not in hashes:
+            hashes.append(digest)
+        return digest
+
+    def _write_blob(self, digest: str, image: Image.Image):
+        os.makedirs(os.path.dirname(self._blob_base(digest)), exist_ok=True)
+        original = self.original_path(digest)
+        image.save(original, format="PNG", optimize=True)
+
+        rgb = image.convert("RGB") if image.mode not in ("RGB", "L") else image
+        thumb = rgb.copy()
+        thumb.thumbnail(THUMB_SIZE)
+        thumb.save(self.thumb_path(digest), format="WEBP", quality=80)
+        display = rgb.copy()
+        display.thumbnail(DISPLAY_SIZE)
+        display.save(self.display_path(digest), format="JPEG", quality=85, optimize=True)
+
+        self.images[digest] = [image.size[0], image.size[1], os.path.getsize(original)]
+
+    # -------- 查询 --------
+    def hashes_for_positions(self, positions) -> List[tuple]:
+        """返回 [(位置, 哈希), ...]，同一哈希只出现一次"""
+        result, seen = [], set()
+        for pos in positions:
+            for digest in self.positions.get(str(pos), []):
+                if digest not in seen:
+                    seen.add(digest)
+                    result.append((pos, digest))
+        return result
+
+
+# -------- 迁移工具 --------
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
+
+
+def _read_time(paths: List[str]) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, "rb") as f:
+            f.read()
+    return (time.perf_counter() - start) / max(1, len(paths))
+
+
+def migrate_pictures_dir(pictures_dir: str, remove_originals=False) -> Dict[str, float]:
+    """将 paragraph_{pos}_image_{n}.png 形式的旧目录迁移到内容哈希存储，并统计效果"""
+    legacy = sorted(name for name in os.listdir(pictures_dir) if LEGACY_NAME.match(name))
+    if not legacy:
+        print("没有需要迁移的图片")
+        return {}
+    legacy_paths = [os.path.join(pictures_dir, name) for name in legacy]
+    legacy_bytes = sum(os.path.getsize(p) for p in legacy_paths)
+
+    store = ImageStore(pictures_dir)
+    for name, path in zip(legacy, legacy_paths):
+        pos = LEGACY_NAME.match(name).group(1)
+        position = -1 if pos == "unassigned" else int(pos)
+        with open(path, "rb") as f:
+            store.put(f.read(), position)
+    store.save()
+
+    originals = [store.original_path(d) for d in store.images]
+    displays = [store.display_path(d) for d in store.images]
+    stats = {
+        "legacy_files": len(legacy),
+        "unique_images": len(store.images),
+        "legacy_bytes": legacy_bytes,
+        "original_bytes": sum(os.path.getsize(p) for p in originals),
+        "store_bytes": _dir_size(store.blob_dir) + os.path.getsize(store.manifest_path),
+        "display_bytes": sum(os.path.getsize(p) for p in displays),
+        "legacy_read_ms": _read_time(legacy_paths) * 1000,
+        "display_read_ms": _read_time(displays) * 1000,
+    }
+
+    if remove_originals:
+        for path in legacy_paths:
+            os.remove(path)
+
+    mb = 1024 * 1024
+    print(f"旧图片 {stats['legacy_files']} 张, 去重后 {stats['unique_images']} 张")
+    print(f"旧目录 {stats['legacy_bytes'] / mb:.1f} MB -> 新存储 {stats['store_bytes'] / mb:.1f} MB "
+          f"(原图 {stats['original_bytes'] / mb:.1f} MB, 含缩略图和展示图)")
+    if remove_originals:
+        print(f"节省磁盘空间 {(stats['legacy_bytes'] - stats['store_bytes']) / mb:.1f} MB")
+    print(f"单张网页传输体积 {stats['legacy_bytes'] / len(legacy) / 1024:.0f} KB -> "
+          f"{stats['display_bytes'] / len(displays) / 1024:.0f} KB")
+    print(f"单张读取耗时 {stats['legacy_read_ms']:.2f} ms -> {stats['display_read_ms']:.2f} ms")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内容哈希图片库工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="迁移旧的 Pictures 目录")
+    migrate.add_argument("--pictures", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "Pictures"))
+    migrate.add_argument("--remove-originals", action="store_true", help="迁移后删除旧文件")
+    args = parser.parse_args()
+    if args.command == "migrate":
+        migrate_pictures_dir(args.pictures, args.remove_originals)
+
+
+if __name__ == "__main__":
+    main()
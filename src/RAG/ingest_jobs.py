@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""后台索引构建任务队列
+
+任务在单独的工作线程中依次执行: 解析 DOCX -> 分批嵌入 -> 保存 -> 热替换。
+新索引先构建在临时目录中, 完成后替换集合目录下的文件, 再把新加载的 RAGSystem 放入集合管理器。
+默认集合是随项目发布的教材索引, 其目录下没有原始 DOCX, 不能通过上传重建。
+
+多进程部署时任务在接收上传的工作进程中执行, 任务状态写入 corpora/.jobs 下的 JSON 文件,
+任意工作进程都能查询; 其他进程通过 CollectionManager 检测到索引文件更新后自行重新加载。
+同一集合的任务若在不同进程中同时执行, 以最后完成的为准。
+正在进行的查询继续使用旧的 RAGSystem 对象, 不会中断; 图片按内容哈希存储, 旧图片文件不会被删除。
+"""
+import glob
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+try:
+    from .chunker import TokenChunker
+    from .corpus_collections import DEFAULT_COLLECTION
+except ImportError:
+    from chunker import TokenChunker
+    from corpus_collections import DEFAULT_COLLECTION
+
+
+class IngestJobQueue:
+    def __init__(self, manager, state_dir: Optional[str] = None):
+        # manager 为 CollectionManager, 新索引使用其 rag_factory 和共用嵌入器构建
+        self.manager = manager
+        self.rag_factory = manager.rag_factory
+        # 以 . 开头的目录不会被当作集合
+        self.state_dir = state_dir or os.path.join(manager.collections_dir, ".jobs")
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        if hasattr(os, "register_at_fork"):  # Windows 不支持 fork
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # 任务只在提交它的进程中执行
+        self.jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="rag-ingest", daemon=True)
+            self._worker.start()
+
+    def collection_dir(self, collection: str) -> str:
+        """校验可以重建的集合并返回其目录, 不可重建时抛出 ValueError"""
+        if collection == DEFAULT_COLLECTION:
+            raise ValueError("默认集合不能通过上传重建, 请指定其他集合名称")
+        return self.manager.collection_dir(collection)
+
+    def submit(self, collection: str) -> Dict[str, Any]:
+        """为集合创建重建索引任务, 使用集合目录下的全部 DOCX 文件"""
+        self.collection_dir(collection)
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "collection": collection,
+            "status": "queued",
+            "stage": None,
+            "done": 0,
+            "total": 0,
+            "throughput": None,
+            "eta_seconds": None,
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "segments": None,
+            "dedup": None,
+            "error": None,
+        }
+        with self._lock:
+            self.jobs[job["id"]] = job
+            self._persist(job)
+        self._queue.put(job["id"])
+        self._ensure_worker()
+        return self.get(job["id"])
+
+    def _persist(self, job):
+        # 调用方需持有锁
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = os.path.join(self.state_dir, f"{job['id']}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read(self, filename) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.state_dir, filename), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """本进程的任务直接返回, 其他进程的任务从状态文件读取"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job:
+                return dict(job)
+        if not job_id.isalnum():
+            return None
+        return self._read(f"{job_id}.json")
+
+    def list(self) -> List[Dict[str, Any]]:
+        jobs = {}
+        if os.path.isdir(self.state_dir):
+            for filename in os.listdir(self.state_dir):
+                job = self._read(filename) if filename.endswith(".json") else None
+                if job:
+                    jobs[job["id"]] = job
+        with self._lock:
+            jobs.update((job_id, dict(job)) for job_id, job in self.jobs.items())
+        return sorted(jobs.values(), key=lambda j: j["created"], reverse=True)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self.jobs[job_id].update(fields)
+            self._persist(self.jobs[job_id])
+
+    def _progress(self, job_id, stage):
+        stage_start = time.time()
+        self._update(job_id, stage=stage, done=0, total=0, throughput=None, eta_seconds=None)
+
+        def report(done, total):
+            elapsed = time.time() - stage_start
+            rate = done / elapsed if elapsed > 0 else None
+            eta = (total - done) / rate if rate else None
+            self._update(job_id, done=done, total=total, throughput=rate, eta_seconds=eta)
+        return report
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            self._update(job_id, status="running", started=time.time())
+            try:
+                segments = self._build(job_id, self.get(job_id)["collection"])
+                self._update(job_id, status="succeeded", stage="done", segments=segments, eta_seconds=0)
+            except Exception as e:
+                print(f"索引任务 {job_id} 失败: {e}")
+                self._update(job_id, status="failed", error=str(e))
+            finally:
+                self._update(job_id, finished=time.time())
+                self._queue.task_done()
+
+    def _build(self, job_id, collection) -> int:
+        target_dir = self.manager.collection_dir(collection)
+        file_paths = sorted(glob.glob(os.path.join(target_dir, "*.docx")))
+        if not file_paths:
+            raise FileNotFoundError("集合目录下没有 DOCX 文件")
+
+        staging_dir = os.path.join(self.manager.collections_dir, f".staging-{job_id}")
+        try:
+            rag = self.rag_factory(staging_dir, self.manager.embedder)
+            rag.process_file(file_paths, min_paragraph_length=5, progress=self._progress(job_id, "extract"))
+            rag.create_vector_store(chunker=TokenChunker(), progress=self._progress(job_id, "embed"),
+                                    reduce_dim=int(os.getenv("RAG_REDUCED_DIM", 0)) or None)
+            segments = len(rag.documents)
+            self._update(job_id, dedup=rag.dedup_stats)
+
+            self._update(job_id, stage="swap")
+            self._swap_in(staging_dir, target_dir)
+            self.manager.put(collection, self.rag_factory(target_dir, self.manager.embedder))
+            return segments
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    @staticmethod
+    def _swap_in(staging_dir, target_dir):
+        os.makedirs(target_dir, exist_ok=True)
+        # 向量库目录: 先移走旧目录再换入新目录, 两次 rename 之间加载的查询会使用内存中的旧索引
+        new_store = os.path.join(staging_dir, "vector_store.faiss")
+        old_store = os.path.join(target_dir, "vector_store.faiss")
+        backup = old_store + ".old"
+        shutil.rmtree(backup, ignore_errors=True)
+        if os.path.exists(old_store):
+            os.replace(old_store, backup)
+        os.replace(new_store, old_store)
+        shutil.rmtree(backup, ignore_errors=True)
+        os.replace(os.path.join(staging_dir, "documents.pkl"), os.path.join(target_dir, "documents.pkl"))
+
+        # 图片: 内容哈希命名不会冲突, 只补充新文件, 最后原子替换清单
+        new_pictures = os.path.join(staging_dir, "Pictures")
+        old_pictures = os.path.join(target_dir, "Pictures")
+        for dirpath, _, filenames in os.walk(os.path.join(new_pictures, "blobs")):
+            rel = os.path.relpath(dirpath, new_pictures)
+            os.makedirs(os.path.join(old_pictures, rel), exist_ok=True)
+            for name in filenames:
+                dest = os.path.join(old_pictures, rel, name)
+                if not os.path.exists(dest):
+                    os.replace(os.path.join(dirpath, name), dest)
+        manifest = os.path.join(new_pictures, "manifest.json")
+        if os.path.exists(manifest):
+            os.replace(manifest, os.path.join(old_pictures, "manifest.json"))
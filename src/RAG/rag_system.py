@@ -1,20 +1,42 @@
 # -*- coding: utf-8 -*-
 import os
 import re
+import argparse
 import unicodedata
 import pickle
 import glob
-import io
 import shutil
 from pathlib import Path
 from typing import List
 import base64
 from docx import Document
 from docx.oxml.ns import qn
-from PIL import Image
 from sentence_transformers import SentenceTransformer
 from langchain_community.vectorstores import FAISS
 from langchain.embeddings.base import Embeddings
+import faiss
+import gc
+import numpy as np
+import threading
+import time
+try:
+    from .embedding_batcher import BatchedEmbeddings
+    from .image_store import ImageStore
+    from .context_assembler import assemble_context, format_context
+    from .chunker import TokenChunker
+    from .section_index import SectionIndex, heading_level, SECTION_SEP
+    from .corpus_collections import CollectionManager, DEFAULT_COLLECTION
+    from .dedup import dedup_segments
+    from .reduced_index import ReducedIndex
+except ImportError:  # 直接运行 rag_system.py 时
+    from embedding_batcher import BatchedEmbeddings
+    from image_store import ImageStore
+    from context_assembler import assemble_context, format_context
+    from chunker import TokenChunker
+    from section_index import SectionIndex, heading_level, SECTION_SEP
+    from corpus_collections import CollectionManager, DEFAULT_COLLECTION
+    from dedup import dedup_segments
+    from reduced_index import ReducedIndex
 
 # -------- 段落处理工具 --------
 def merge_segments(text, min_length=80):
@@ -51,10 +73,50 @@ def clean_text(text):
 
 # -------- 嵌入模型封装 --------
 class SentenceTransformerEmbeddings(Embeddings):
-    def __init__(self, model_name):
+    def __init__(self, model_name, lazy=False):
         # 假设 model_name 是模型文件夹名，例如 "bge-large-zh-v1.5"
-        model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model", model_name)
-        self.model = SentenceTransformer(model_path, local_files_only=True)
+        self.model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model", model_name)
+        self._model = None
+        self._lock = threading.Lock()
+        self.last_used = time.monotonic()
+        # lazy=True 时在第一次编码时才加载模型, 卸载后也会在下次编码时重新加载
+        if not lazy:
+            self._load()
+        if hasattr(os, "register_at_fork"):  # Windows 不支持 fork
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # 模型权重与父进程按写时复制共享, 只重建锁
+        self._lock = threading.Lock()
+
+    def _load(self):
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = SentenceTransformer(self.model_path, local_files_only=True)
+                model = self._model
+        return model
+
+    @property
+    def model(self):
+        self.last_used = time.monotonic()
+        return self._load()
+
+    def is_loaded(self):
+        return self._model is not None
+
+    def unload(self):
+        # 正在进行的编码持有模型引用, 不受影响
+        with self._lock:
+            self._model = None
+        gc.collect()
+
+    def memory_bytes(self):
+        model = self._model
+        if model is None:
+            return 0
+        return sum(p.numel() * p.element_size() for p in model.parameters())
 
     def embed_documents(self, texts):
         return self.model.encode(texts, show_progress_bar=True).tolist()
@@ -62,28 +124,51 @@ class SentenceTransformerEmbeddings(Embeddings):
     def embed_query(self, text):
         return self.model.encode([text], show_progress_bar=False)[0].tolist()
 
+    def embed_queries(self, texts):
+        # 一次前向计算编码多条查询, 供批处理器使用
+        return self.model.encode(texts, batch_size=len(texts), show_progress_bar=False).tolist()
+
 # -------- 核心 RAG 系统 --------
 class RAGSystem:
-    def __init__(self, model_name="bge-large-zh-v1.5"):
-        self.base_dir = os.path.dirname(os.path.abspath(__file__))
+    def __init__(self, model_name="bge-large-zh-v1.5", batch_window_ms=None, max_batch_size=32, context_token_budget=1500,
+                 collection_dir=None, embedder=None, mmap_index=False, reduced_search=False):
+        # collection_dir 为集合目录, 默认是本模块所在目录; 多个集合可共用同一个 embedder
+        self.base_dir = collection_dir or os.path.dirname(os.path.abspath(__file__))
+        os.makedirs(self.base_dir, exist_ok=True)
         self.vector_store_path = os.path.join(self.base_dir, "vector_store.faiss")
         self.documents_path = os.path.join(self.base_dir, "documents.pkl")
         self.pictures_dir = os.path.join(self.base_dir, "Pictures")
         os.makedirs(self.pictures_dir, exist_ok=True)
-        self.embedder = SentenceTransformerEmbeddings(model_name)
+        self.image_store = ImageStore(self.pictures_dir)
+        self.embedder = embedder or SentenceTransformerEmbeddings(model_name)
+        # 设置 batch_window_ms 后, 并发查询会在该时间窗口内合并编码
+        if embedder is None and batch_window_ms is not None:
+            self.embedder = BatchedEmbeddings(self.embedder, batch_window_ms, max_batch_size)
+        self.context_token_budget = context_token_budget  # 检索上下文的 token 预算
+        self.mmap_index = mmap_index  # 以内存映射方式加载索引, 卸载后重新加载几乎没有开销
+        self.reduced_search = reduced_search  # 存在降维索引时先在降维向量上检索, 再用全维向量重排
+        self.reduced_index = None
         self.vector_store = None
         self.documents = []
         self.images = []
+        self.sections = []  # 与 documents 一一对应的章节路径
+        self.section_index = None
+        self.dedup_stats = None  # 最近一次建索引时的去重统计
         self.load_vector_store()
 
-    # 提取 DOCX 文档中的文本和图片
-    def extract_text_from_docx(self, docx_path, min_paragraph_length=30):
+    # 提取 DOCX 文档中的文本、图片以及每个段落所属的章节
+    def extract_text_from_docx(self, docx_path, min_paragraph_length=30, max_heading_depth=2):
         doc = Document(docx_path)
-        full_text, images = [], []
+        full_text, images, sections = [], [], []
+        heading_path = []
         rels = doc.part.rels
         for para_idx, para in enumerate(doc.paragraphs):
-            # 跳过标题样式的段落
-            if para.style.name.startswith('Heading'):
+            # 标题段落不作为正文, 只用于记录章节层级
+            level = heading_level(para.style.name)
+            if level is not None:
+                title = para.text.strip()
+                if title:
+                    heading_path = heading_path[:level - 1] + [title]
                 continue
             
             paragraph_text, para_images, image_counter = [], [], 0
@@ -102,12 +187,10 @@ class RAGSystem:
                     if embed_id and embed_id in rels:
                         image_counter += 1
                         position = len(full_text)
-                        filename = f"paragraph_{position}_image_{image_counter}.png"
-                        path = os.path.join(self.pictures_dir, filename)
                         try:
-                            image = Image.open(io.BytesIO(rels[embed_id].target_part.blob))
-                            image.save(path)
-                            para_images.append({"filename": filename, "position": position, "rel_id": embed_id})
+                            # 按内容哈希存储, 重复出现的图片只保存一份
+                            digest = self.image_store.put(rels[embed_id].target_part.blob, position)
+                            para_images.append({"hash": digest, "position": position, "rel_id": embed_id})
                         except Exception as e:
                             print(f"保存图片失败: {e}")
             # 合并段落文本
@@ -116,98 +199,235 @@ class RAGSystem:
                 # 丢弃过短的段落（可能是标题或无意义片段）
                 if combined and len(combined) >= min_paragraph_length:
                     full_text.append(combined)
+                    sections.append(SECTION_SEP.join(heading_path[:max_heading_depth]))
                     images.extend(para_images)
 
         # 文档级图片
         for rel_id, rel in rels.items():
             if "image" in rel.target_ref and rel_id not in [img["rel_id"] for img in images if "rel_id" in img]:
-                filename = f"paragraph_unassigned_image_{len(images)+1}.png"
-                path = os.path.join(self.pictures_dir, filename)
                 try:
-                    image = Image.open(io.BytesIO(rel.target_part.blob))
-                    image.save(path)
-                    images.append({"filename": filename, "position": -1, "rel_id": rel_id})
+                    digest = self.image_store.put(rel.target_part.blob, -1)
+                    images.append({"hash": digest, "position": -1, "rel_id": rel_id})
                 except Exception as e:
                     print(f"保存图片失败: {e}")
-        return full_text, images
+        return full_text, images, sections
 
     # 处理文件，调用提取文本和图片的方法
-    def process_file(self, file_paths):
-        all_text, all_images = [], []
-        for file_path in file_paths:
-            if not file_path.lower().endswith('.docx'):
-                continue
-            text_segments, images = self.extract_text_from_docx(file_path, min_paragraph_length=25)
+    # progress(已处理数, 总数) 用于后台任务汇报进度
+    def process_file(self, file_paths, min_paragraph_length=25, progress=None):
+        all_text, all_images, all_sections = [], [], []
+        self.image_store.clear_positions()
+        file_paths = [p for p in file_paths if p.lower().endswith('.docx')]
+        for done, file_path in enumerate(file_paths, 1):
+            text_segments, images, sections = self.extract_text_from_docx(file_path, min_paragraph_length=min_paragraph_length)
             if text_segments:
                 all_text.extend(text_segments)
                 all_images.extend(images)
+                all_sections.extend(sections)
+            if progress:
+                progress(done, len(file_paths))
         if not all_text:
             raise ValueError("没有提取到任何文本")
+        self.image_store.save()
         self.documents = all_text
         self.images = all_images
+        self.sections = all_sections
         return all_images
 
     # 加载向量存储
     def load_vector_store(self):
         if os.path.exists(self.vector_store_path):
             try:
-                self.vector_store = FAISS.load_local(
-                    self.vector_store_path, self.embedder, allow_dangerous_deserialization=True
-                )
+                if self.mmap_index:
+                    try:
+                        self.vector_store = self._load_mmap_store()
+                    except Exception as e:
+                        # 旧版 faiss 不支持映射 Flat 索引
+                        print(f"内存映射加载失败, 改为完整加载: {e}")
+                        self.mmap_index = False
+                if not self.mmap_index:
+                    self.vector_store = FAISS.load_local(
+                        self.vector_store_path, self.embedder, allow_dangerous_deserialization=True
+                    )
                 if os.path.exists(self.documents_path):
                     with open(self.documents_path, 'rb') as f:
                         self.documents = pickle.load(f)
+                self.section_index = SectionIndex.load(self.vector_store_path)
+                if self.reduced_search:
+                    self.reduced_index = ReducedIndex.load(self.vector_store_path)
+                    total = self.vector_store.index.ntotal
+                    if self.reduced_index is not None and self.reduced_index.index.ntotal != total:
+                        # 向量 ID 与当前索引不对应, 使用会返回错误的文档
+                        print(f"降维索引有 {self.reduced_index.index.ntotal} 个向量, 与索引的 {total} 个不一致, 已忽略")
+                        self.reduced_index = None
                 print(f"向量存储已加载，共 {len(self.documents)} 条文档")
                 return True
             except Exception as e:
                 print(f"加载失败: {e}")
         return False
 
+    # 以只读内存映射方式读取 FAISS 索引, 向量数据按需从页缓存读取, 可在进程间共享
+    def _load_mmap_store(self):
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(os.path.join(self.vector_store_path, "index.faiss"), flags)
+        with open(os.path.join(self.vector_store_path, "index.pkl"), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(self.embedder, index, docstore, index_to_docstore_id)
+
     # 保存向量存储
     def save_vector_store(self):
         if self.vector_store:
             self.vector_store.save_local(self.vector_store_path)
+            if self.section_index is not None:
+                self.section_index.save(self.vector_store_path)
+            else:
+                SectionIndex.remove(self.vector_store_path)
+            if self.reduced_index is not None:
+                self.reduced_index.save(self.vector_store_path)
+            else:
+                ReducedIndex.remove(self.vector_store_path)
             with open(self.documents_path, 'wb') as f:
                 pickle.dump(self.documents, f)
             print("向量存储和文档已保存")
 
-    # 创建向量存储
-    def create_vector_store(self):
+    # 创建向量存储, 传入 chunker 时按 token 数切分, 否则沿用 merge_segments
+    # dedup 为 True 时在嵌入前合并近似重复的片段, 其余副本的段落号记在 duplicate_paragraphs 中
+    # reduce_dim 不为空时同时构建该维数的降维索引(reduce_method 为 pca 或 truncate)
+    def create_vector_store(self, chunker=None, progress=None, batch_size=64, dedup=True,
+                            reduce_dim=None, reduce_method="pca"):
         if not self.documents:
             raise ValueError("没有文档可用于嵌入")
         cleaned_segments, metadata = [], []
-        for doc_idx, doc in enumerate(self.documents):
-            cleaned = clean_text(doc)
-            segments = merge_segments(cleaned)
-            cleaned_segments.extend(segments)
-            metadata.extend([{"original_doc_idx": doc_idx, "paragraph_number": doc_idx + 1}] * len(segments))
-        self.vector_store = FAISS.from_texts(cleaned_segments, self.embedder, metadatas=metadata)
+        if chunker is not None:
+            cleaned_segments, metadata = chunker.chunk_documents([clean_text(doc) for doc in self.documents],
+                                                                 sections=self.sections or None)
+        else:
+            for doc_idx, doc in enumerate(self.documents):
+                cleaned = clean_text(doc)
+                segments = merge_segments(cleaned)
+                cleaned_segments.extend(segments)
+                meta = {"original_doc_idx": doc_idx, "paragraph_number": doc_idx + 1}
+                if self.sections:
+                    meta["section"] = self.sections[doc_idx]
+                metadata.extend([meta] * len(segments))
+        self.dedup_stats = None
+        if dedup:
+            cleaned_segments, metadata, self.dedup_stats = dedup_segments(cleaned_segments, metadata)
+        # 分批嵌入以便汇报进度
+        embeddings = []
+        embed_start = time.perf_counter()
+        for start in range(0, len(cleaned_segments), batch_size):
+            embeddings.extend(self.embedder.embed_documents(cleaned_segments[start:start + batch_size]))
+            if progress:
+                progress(len(embeddings), len(cleaned_segments))
+        if self.dedup_stats and embeddings:
+            stats = self.dedup_stats
+            per_segment = (time.perf_counter() - embed_start) / len(embeddings)
+            stats["embed_seconds_saved"] = per_segment * stats["removed"]
+            stats["index_bytes_saved"] = stats["removed"] * len(embeddings[0]) * 4
+            print(f"去除近似重复片段 {stats['removed']}/{stats['segments']} 条, "
+                  f"节省嵌入约 {stats['embed_seconds_saved']:.1f}s, 索引减小 {stats['index_bytes_saved'] / 1e6:.1f}MB")
+        self.vector_store = FAISS.from_embeddings(
+            list(zip(cleaned_segments, embeddings)), self.embedder, metadatas=metadata
+        )
+        self.section_index = SectionIndex.from_vector_store(self.vector_store)
+        self.reduced_index = None
+        if reduce_dim:
+            self.reduced_index = ReducedIndex.build(np.asarray(embeddings, dtype=np.float32), reduce_dim, reduce_method)
         self.documents = cleaned_segments
         print(f"创建向量存储，共 {len(cleaned_segments)} 段")
         self.save_vector_store()
 
-    # 用户查询接口, 通过向量存储查询相关段落
-    def query(self, question, k=4):
+    # 查找段落及其前后相邻段落中的图片
+    def find_images(self, paragraph_number, seen_images):
+        picture_path = []
+        positions = [paragraph_number - 1, paragraph_number, paragraph_number + 1]
+        if self.image_store.exists():
+            for _, digest in self.image_store.hashes_for_positions(positions):
+                if digest not in seen_images:
+                    picture_path.append(f"段落 {paragraph_number}: {self.image_store.display_path(digest)}")
+                    seen_images.add(digest)
+        else:
+            # 兼容尚未迁移的旧图片目录
+            for fname in os.listdir(self.pictures_dir):
+                for pos in positions:
+                    if re.match(f"^paragraph_{pos}_image_\\d+\\.png$", fname) and fname not in seen_images:
+                        picture_path.append(f"段落 {paragraph_number}: {os.path.join(self.pictures_dir, fname)}")
+                        seen_images.add(fname)
+        return picture_path
+
+    # 返回索引中的全部章节路径
+    def list_sections(self):
+        return list(self.section_index.names) if self.section_index else []
+
+    # 向量检索, 指定 sections 时只搜索这些章节(含下级小节)内的向量
+    def search(self, question, k=4, sections=None):
+        return self.search_by_vector(self.embedder.embed_query(question), k=k, sections=sections)
+
+    def search_by_vector(self, query_vector, k=4, sections=None):
         if not self.vector_store:
             raise ValueError("向量存储未初始化")
-        docs = self.vector_store.similarity_search(question, k=k)
-        context, picture_path, seen_images = [], [], set()
-        image_folder = os.path.join(self.base_dir, "Pictures")
-        for doc in docs:
-            paragraph_number = doc.metadata.get('paragraph_number', '未知')
-            context.append(f"\n段落 {paragraph_number}: {doc.page_content}")
-            if isinstance(paragraph_number, int):
-                positions = [paragraph_number - 1, paragraph_number, paragraph_number + 1]
-                for fname in os.listdir(image_folder):
-                    for pos in positions:
-                        if re.match(f"^paragraph_{pos}_image_\\d+\\.png$", fname) and fname not in seen_images:
-                            picture_path.append(f"段落 {paragraph_number}: {os.path.join(image_folder, fname)}")
-                            seen_images.add(fname)
-        prompt = f"""参考以下《超声原理及生物医学工程应用：生物医学超声学》中的内容以及你的已有知识，对问题给出详细回答：{' '.join(context)} \n问题为: {question}"""
-        return prompt, picture_path
+        if sections and self.section_index is None:
+            print("索引中没有章节信息, 忽略章节过滤")
+            sections = None
+        if self.reduced_search and self.reduced_index is not None:
+            ids = self.section_index.matching_ids(sections) if sections else None
+            return self.reduced_index.search(self.vector_store, query_vector, k, ids)
+        if sections:
+            return self.section_index.search(self.vector_store, query_vector, k, sections)
+        return self.vector_store.similarity_search_with_score_by_vector(query_vector, k=k)
+
+    # 检索并组装结构化上下文: 合并相邻段落、去除重复片段, 并按 token 预算截取
+    def query_context(self, question, k=4, token_budget=None, sections=None):
+        hits = self.search(question, k=k, sections=sections)
+        context = assemble_context(hits, token_budget or self.context_token_budget)
+        picture_path, seen_images = [], set()
+        for seg in context["segments"]:
+            # 去重时合并掉的副本所在段落也可能带有图片
+            for paragraph_number in seg["paragraphs"] + seg.get("duplicate_paragraphs", []):
+                picture_path.extend(self.find_images(paragraph_number, seen_images))
+        context["question"] = question
+        context["images"] = picture_path
+        return context
+
+    # 用户查询接口, 通过向量存储查询相关段落
+    def query(self, question, k=4, token_budget=None, sections=None):
+        context = self.query_context(question, k=k, token_budget=token_budget, sections=sections)
+        prompt = f"""参考以下《超声原理及生物医学工程应用：生物医学超声学》中的内容以及你的已有知识，对问题给出详细回答：\n{format_context(context)} \n问题为: {question}"""
+        return prompt, context["images"]
+
+# 进程内共享的集合管理器, 避免每次查询重新加载模型, 也让并发查询能够合批
+_managers = {}
+_rag_lock = threading.Lock()
+
+def get_collection_manager(model_name="bge-large-zh-v1.5", batch_window_ms=5):
+    with _rag_lock:
+        manager = _managers.get(model_name)
+        if manager is None:
+            # 内存预算模式: RAG_IDLE_TIMEOUT 秒无查询后卸载模型和索引, 下次查询时重新加载
+            idle_timeout = int(os.getenv("RAG_IDLE_TIMEOUT", 0))
+            mmap_index = os.getenv("RAG_MMAP_INDEX", "0") == "1"
+            # 降维检索时全维索引不会被访问, 配合 RAG_MMAP_INDEX 不占用常驻内存
+            reduced_search = os.getenv("RAG_REDUCED_SEARCH", "0") == "1"
+            base_embedder = SentenceTransformerEmbeddings(model_name, lazy=idle_timeout > 0)
+            embedder = BatchedEmbeddings(base_embedder, batch_window_ms)
+            manager = CollectionManager(
+                lambda path, shared: RAGSystem(model_name=model_name, collection_dir=path, embedder=shared,
+                                               mmap_index=mmap_index, reduced_search=reduced_search),
+                embedder,
+                os.path.dirname(os.path.abspath(__file__)),
+                memory_limit_mb=int(os.getenv("RAG_MEMORY_LIMIT_MB", 2048)),
+            )
+            if idle_timeout > 0:
+                manager.start_idle_eviction(idle_timeout)
+            _managers[model_name] = manager
+        return manager
+
+def get_rag_system(model_name="bge-large-zh-v1.5", collection=DEFAULT_COLLECTION):
+    return get_collection_manager(model_name).get(collection)
 
 def call_rag_query(question, model_name="bge-large-zh-v1.5"):
-    rag = RAGSystem(model_name=model_name)  # 初始化 RAGSystem
+    rag = get_rag_system(model_name)  # 获取共享的 RAGSystem
     try:
         result, picture_path = rag.query(question, k = 4) # k 是返回的相似文本块数量，k=1 就是只输出最相关的一段文字
         return result, picture_path
@@ -215,6 +435,19 @@ def call_rag_query(question, model_name="bge-large-zh-v1.5"):
         print(f"查询失败: {e}")
         return None, []
 
+def call_rag_context(question, model_name="bge-large-zh-v1.5", k=4, token_budget=None, sections=None, collections=None):
+    """返回结构化上下文, 供页面处理器直接组织消息; 指定多个集合时并行检索并按得分合并"""
+    try:
+        if collections and collections != [DEFAULT_COLLECTION]:
+            manager = get_collection_manager(model_name)
+            return manager.query_context(question, collections, k=k, token_budget=token_budget or 1500,
+                                         sections=sections)
+        rag = get_rag_system(model_name, collections[0] if collections else DEFAULT_COLLECTION)
+        return rag.query_context(question, k=k, token_budget=token_budget, sections=sections)
+    except Exception as e:
+        print(f"查询失败: {e}")
+        return None
+
 def copy_images_to_static(image_paths: List[str], static_folder: str) -> List[str]:
     """将RAG系统找到的相关图片复制到static/related_images目录下
 
@@ -243,7 +476,9 @@ def copy_images_to_static(image_paths: List[str], static_folder: str) -> List[st
         # 复制图片到static目录
         dest_path = os.path.join(related_images_dir, filename)
         try:
-            shutil.copy2(full_path, dest_path)
+            # 内容哈希命名的图片已复制过时无需再次复制
+            if filename.startswith('paragraph_') or not os.path.exists(dest_path):
+                shutil.copy2(full_path, dest_path)
             # 生成相对URL路径
             url = f'/static/related_images/{filename}'
             image_urls.append({
@@ -257,13 +492,21 @@ def copy_images_to_static(image_paths: List[str], static_folder: str) -> List[st
         
 # -------- 主入口 --------
 def main():
-    rag = RAGSystem()
+    parser = argparse.ArgumentParser(description="构建并测试 RAG 索引")
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION, help="集合名称, 其文档放在 corpora/<名称>/ 下")
+    parser.add_argument("--reduce-dim", type=int, help="同时构建该维数的降维索引, 如 256 或 384")
+    parser.add_argument("--reduce-method", choices=["pca", "truncate"], default="pca")
+    args = parser.parse_args()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    collection_dir = None if args.collection == DEFAULT_COLLECTION else os.path.join(base_dir, "corpora", args.collection)
+    rag = RAGSystem(collection_dir=collection_dir, reduced_search=bool(args.reduce_dim))
     file_paths = glob.glob(os.path.join(rag.base_dir, "*.docx"))
     if not rag.vector_store:
         if not file_paths:
             raise FileNotFoundError("目录下没有 DOCX 文件")
-        rag.process_file(file_paths)
-        rag.create_vector_store()
+        # token 切分会合并短段落, 因此只过滤极短的噪声段落
+        rag.process_file(file_paths, min_paragraph_length=5)
+        rag.create_vector_store(chunker=TokenChunker(), reduce_dim=args.reduce_dim, reduce_method=args.reduce_method)
     question = "超声换能器有哪些"
     prompt, images = rag.query(question)
     print(prompt)
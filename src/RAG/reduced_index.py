@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""降维索引 + 全精度重排
+
+第一轮在降到 256/384 维的向量上检索 rerank_k 个候选, 再用内存映射的 float16 全维向量计算精确 L2 距离重排,
+返回的距离与原索引一致, 上下文组装等下游逻辑不受影响。全维向量只读取候选所在的行, 不需要常驻内存。
+
+降维方式:
+    pca       在索引向量上学习 PCA 投影
+    truncate  直接截取前若干维(Matryoshka 方式), bge-large-zh 并非按此训练, 召回率通常低于 pca
+
+为已有索引构建并对比内存、延迟和 recall@k:
+    python reduced_index.py build --dim 256 --method pca
+    python reduced_index.py bench --questions questions.txt -k 4
+
+内存按向量数和维数估算(FAISS 扁平索引的数据即为这些数组), 另报告进程实际的常驻内存。
+不提供 --questions 时使用内置的少量教材问题; --synthetic 改用加噪声的索引向量作查询,
+查询与索引向量过于接近, recall@k 明显偏高, 只适合冒烟测试。
+"""
+import argparse
+import os
+import time
+from typing import Optional
+
+import faiss
+import numpy as np
+
+try:
+    from .section_index import SectionIndex
+    from .corpus_collections import process_rss
+except ImportError:
+    from section_index import SectionIndex
+    from corpus_collections import process_rss
+
+DEFAULT_QUESTIONS = [
+    "压电效应的原理是什么",
+    "声阻抗差异如何影响界面反射",
+    "换能器匹配层的作用",
+    "组织对超声的衰减与频率的关系",
+    "轴向分辨力和侧向分辨力由什么决定",
+    "彩色多普勒如何评估血流",
+    "混叠伪像产生的原因",
+    "相控阵探头如何实现波束偏转和聚焦",
+    "近场和远场的分界与探头孔径的关系",
+    "机械指数和热指数的含义",
+]
+
+
+class ReducedIndex:
+    """
+    Args:
+        index: 降维向量上的 FAISS 索引, 向量 ID 与原索引一致
+        mean, components: 投影 x -> (x - mean) @ components.T; truncate 时 components 为单位矩阵的前若干行
+        full_vectors: 全维 float16 向量矩阵(通常为 np.memmap)
+        rerank_factor: 候选数为 k 的若干倍, 至少 min_candidates 个
+    """
+
+    INDEX_FILE = "reduced.faiss"
+    PROJECTION_FILE = "projection.npz"
+    VECTORS_FILE = "full_vectors.f16.npy"
+
+    def __init__(self, index, mean: np.ndarray, components: np.ndarray, full_vectors: np.ndarray,
+                 method: str = "pca", rerank_factor: int = 4, min_candidates: int = 32):
+        self.index = index
+        self.mean = mean
+        self.components = components
+        self.full_vectors = full_vectors
+        self.method = method
+        self.rerank_factor = rerank_factor
+        self.min_candidates = min_candidates
+
+    @property
+    def dim(self) -> int:
+        return self.components.shape[0]
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray((vectors - self.mean) @ self.components.T, dtype=np.float32)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, dim: int = 256, method: str = "pca") -> "ReducedIndex":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        d = vectors.shape[1]
+        dim = min(dim, d)
+        if method == "pca":
+            mean = vectors.mean(axis=0)
+            # 样本数少于维数时主成分个数受限于样本数
+            _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+            components = vt[:dim]
+            if components.shape[0] < dim:
+                components = np.vstack([components, np.zeros((dim - components.shape[0], d), dtype=np.float32)])
+        elif method == "truncate":
+            mean = np.zeros(d, dtype=np.float32)
+            components = np.eye(d, dtype=np.float32)[:dim]
+        else:
+            raise ValueError(f"未知的降维方式: {method}")
+        reduced = cls(None, mean.astype(np.float32), components.astype(np.float32),
+                      vectors.astype(np.float16), method)
+        reduced.index = faiss.IndexFlatL2(dim)
+        reduced.index.add(reduced.project(vectors))
+        return reduced
+
+    @classmethod
+    def from_vector_store(cls, vector_store, dim: int = 256, method: str = "pca") -> "ReducedIndex":
+        index = vector_store.index
+        return cls.build(index.reconstruct_n(0, index.ntotal), dim, method)
+
+    @classmethod
+    def load(cls, folder) -> Optional["ReducedIndex"]:
+        paths = [os.path.join(folder, name) for name in (cls.INDEX_FILE, cls.PROJECTION_FILE, cls.VECTORS_FILE)]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        projection = np.load(paths[1])
+        return cls(faiss.read_index(paths[0]), projection["mean"], projection["components"],
+                   np.load(paths[2], mmap_mode="r"), str(projection["method"]))
+
+    @classmethod
+    def remove(cls, folder):
+        """删除目录中的降维索引文件, 不带降维索引重建时避免加载到与新索引不对应的旧文件"""
+        for name in (cls.INDEX_FILE, cls.PROJECTION_FILE, cls.VECTORS_FILE):
+            try:
+                os.remove(os.path.join(folder, name))
+            except FileNotFoundError:
+                pass
+
+    def save(self, folder):
+        faiss.write_index(self.index, os.path.join(folder, self.INDEX_FILE))
+        np.savez(os.path.join(folder, self.PROJECTION_FILE), mean=self.mean, components=self.components,
+                 method=np.array(self.method))
+        np.save(os.path.join(folder, self.VECTORS_FILE), np.asarray(self.full_vectors, dtype=np.float16))
+
+    def memory_bytes(self) -> int:
+        """常驻内存估算: 降维索引和投影矩阵, 不含按需读取的全维向量"""
+        return self.index.ntotal * self.dim * 4 + self.components.nbytes + self.mean.nbytes
+
+    def search_ids(self, query_vector, k: int, ids: Optional[np.ndarray] = None):
+        """返回按精确距离排序的 (向量 ID, 距离) 列表, ids 限定可选的向量"""
+        query = np.asarray([query_vector], dtype=np.float32)
+        limit = self.index.ntotal if ids is None else len(ids)
+        candidates = min(limit, max(k * self.rerank_factor, self.min_candidates))
+        if candidates <= 0:
+            return []
+        params = None if ids is None else faiss.SearchParameters(sel=SectionIndex.selector(ids))
+        _, indices = self.index.search(self.project(query), candidates, params=params)
+        found = np.sort(indices[0][indices[0] >= 0])
+        if len(found) == 0:
+            return []
+        # 只读取候选行的全维向量计算精确距离
+        full = np.asarray(self.full_vectors[found], dtype=np.float32)
+        distances = ((full - query) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:k]
+        return [(int(found[i]), float(distances[i])) for i in order]
+
+    def search(self, vector_store, query_vector, k: int, ids: Optional[np.ndarray] = None):
+        """与 FAISS 向量库检索的返回格式相同: [(Document, 距离)]"""
+        return [(vector_store.docstore.search(vector_store.index_to_docstore_id[idx]), distance)
+                for idx, distance in self.search_ids(query_vector, k, ids)]
+
+
+def benchmark(vector_store, reduced: ReducedIndex, queries: np.ndarray, k: int = 4):
+    """对比全维索引与降维重排的内存、延迟和 recall@k(以全维精确检索结果为准)"""
+    full_times, reduced_times, recall = [], [], 0.0
+    for query in queries:
+        start = time.perf_counter()
+        _, exact = vector_store.index.search(np.asarray([query], dtype=np.float32), k)
+        full_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        approx = reduced.search_ids(query, k)
+        reduced_times.append(time.perf_counter() - start)
+        expected = set(int(i) for i in exact[0] if i >= 0)
+        recall += len(expected & {idx for idx, _ in approx}) / max(1, len(expected))
+
+    def p95(values):
+        return sorted(values)[min(len(values) - 1, int(len(values) * 0.95))]
+
+    n, d = vector_store.index.ntotal, vector_store.index.d
+    return {
+        "vectors": n,
+        "full_dim": d,
+        "reduced_dim": reduced.dim,
+        "full_memory_estimate_mb": n * d * 4 / 1e6,
+        "reduced_memory_estimate_mb": reduced.memory_bytes() / 1e6,
+        "float16_on_disk_mb": n * d * 2 / 1e6,
+        "process_rss_mb": process_rss() / 1e6,
+        "full_latency_ms": sum(full_times) / len(full_times) * 1000,
+        "full_p95_ms": p95(full_times) * 1000,
+        "reduced_latency_ms": sum(reduced_times) / len(reduced_times) * 1000,
+        "reduced_p95_ms": p95(reduced_times) * 1000,
+        f"recall@{k}": recall / len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="降维索引")
+    parser.add_argument("command", choices=["build", "bench"])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--method", choices=["pca", "truncate"], default="pca")
+    parser.add_argument("--collection-dir", help="集合目录, 默认为原教材")
+    parser.add_argument("--questions", help="bench 使用的问题文件, 每行一个问题; 默认使用内置的教材问题")
+    parser.add_argument("--synthetic", action="store_true", help="用加噪声的索引向量作查询(recall 偏高, 仅作冒烟测试)")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+
+    from rag_system import RAGSystem
+    rag = RAGSystem(collection_dir=args.collection_dir)
+    if rag.vector_store is None:
+        raise SystemExit("没有可用的向量索引")
+
+    if args.command == "build":
+        start = time.perf_counter()
+        reduced = ReducedIndex.from_vector_store(rag.vector_store, args.dim, args.method)
+        reduced.save(rag.vector_store_path)
+        print(f"已构建 {args.method} {reduced.dim} 维索引, 用时 {time.perf_counter() - start:.1f}s")
+        return
+
+    if args.synthetic:
+        print("警告: 合成查询与索引向量过于接近, recall@k 偏高, 不能作为结论")
+        vectors = rag.vector_store.index.reconstruct_n(0, rag.vector_store.index.ntotal)
+        rng = np.random.default_rng(0)
+        picked = vectors[rng.choice(len(vectors), min(args.samples, len(vectors)), replace=False)]
+        queries = picked + rng.normal(0, picked.std(), picked.shape).astype(np.float32) * 0.5
+    else:
+        questions = DEFAULT_QUESTIONS
+        if args.questions:
+            with open(args.questions, "r", encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()]
+        # 与线上查询相同, 按查询方式编码问题
+        queries = np.asarray([rag.embedder.embed_query(q) for q in questions], dtype=np.float32)
+        print(f"使用 {len(questions)} 个真实问题")
+
+    for dim in sorted({args.dim, 256, 384}):
+        for method in ("pca", "truncate"):
+            result = benchmark(rag.vector_store, ReducedIndex.from_vector_store(rag.vector_store, dim, method),
+                               queries, args.k)
+            print(f"{method:<9}{dim:>4} 维  内存(估算) {result['full_memory_estimate_mb']:.1f}MB -> "
+                  f"{result['reduced_memory_estimate_mb']:.1f}MB  "
+                  f"延迟 {result['full_latency_ms']:.2f}ms -> {result['reduced_latency_ms']:.2f}ms  "
+                  f"recall@{args.k} {result[f'recall@{args.k}']:.3f}")
+    print(f"进程常驻内存(实测, 含嵌入模型和全维索引) {process_rss() / 1e6:.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
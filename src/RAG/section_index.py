@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import re
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+SECTION_SEP = " > "
+_HEADING_LEVEL = re.compile(r'^(?:Heading|标题)\s*(\d+)')
+
+
+def heading_level(style_name):
+    """返回标题样式的级别, 非标题段落返回 None"""
+    match = _HEADING_LEVEL.match(style_name or "")
+    return int(match.group(1)) if match else None
+
+
+class SectionIndex:
+    """向量 ID 到章节的紧凑映射, 用于按章节过滤检索
+
+    names 为章节路径列表(如 "第二章 超声换能器 > 2.1 压电效应"),
+    ids 为 int32 数组, 第 i 个元素是 FAISS 内部第 i 个向量所属章节在 names 中的下标(-1 表示未知)。
+    """
+
+    NAMES_FILE = "sections.json"
+    IDS_FILE = "sections.npy"
+
+    def __init__(self, names: List[str], ids: np.ndarray):
+        self.names = names
+        self.ids = ids
+
+    @classmethod
+    def from_vector_store(cls, vector_store) -> Optional["SectionIndex"]:
+        """没有任何片段带章节信息时返回 None, 与缺少索引文件时的 load 一致"""
+        names, lookup = [], {}
+        ids = np.full(vector_store.index.ntotal, -1, dtype=np.int32)
+        for i in range(vector_store.index.ntotal):
+            doc = vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+            section = getattr(doc, "metadata", {}).get("section")
+            if not section:
+                continue
+            if section not in lookup:
+                lookup[section] = len(names)
+                names.append(section)
+            ids[i] = lookup[section]
+        if not names:
+            return None
+        return cls(names, ids)
+
+    @classmethod
+    def load(cls, folder) -> Optional["SectionIndex"]:
+        names_path = os.path.join(folder, cls.NAMES_FILE)
+        ids_path = os.path.join(folder, cls.IDS_FILE)
+        if not (os.path.exists(names_path) and os.path.exists(ids_path)):
+            return None
+        with open(names_path, "r", encoding="utf-8") as f:
+            names = json.load(f)
+        return cls(names, np.load(ids_path))
+
+    @classmethod
+    def remove(cls, folder):
+        """删除目录中的章节索引文件, 重建无章节的索引时避免加载到旧文件"""
+        for name in (cls.NAMES_FILE, cls.IDS_FILE):
+            try:
+                os.remove(os.path.join(folder, name))
+            except FileNotFoundError:
+                pass
+
+    def save(self, folder):
+        with open(os.path.join(folder, self.NAMES_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.names, f, ensure_ascii=False)
+        np.save(os.path.join(folder, self.IDS_FILE), self.ids)
+
+    def matching_ids(self, sections: List[str]) -> np.ndarray:
+        """返回属于给定章节(含其下级小节)的全部向量 ID"""
+        wanted = [i for i, name in enumerate(self.names)
+                  if any(name == s or name.startswith(s + SECTION_SEP) for s in sections)]
+        if not wanted:
+            return np.empty(0, dtype=np.int64)
+        return np.nonzero(np.isin(self.ids, wanted))[0].astype(np.int64)
+
+    @staticmethod
+    def selector(ids: np.ndarray):
+        # 章节内的向量按文档顺序连续存放, 连续时使用区间选择器
+        if len(ids) and ids[-1] - ids[0] + 1 == len(ids):
+            return faiss.IDSelectorRange(int(ids[0]), int(ids[-1]) + 1)
+        return faiss.IDSelectorBatch(ids)
+
+    def search(self, vector_store, query_vector, k, sections):
+        """只在指定章节的向量中检索, 返回 [(Document, 距离)]"""
+        ids = self.matching_ids(sections)
+        if len(ids) == 0:
+            return []
+        query = np.asarray([query_vector], dtype=np.float32)
+        params = faiss.SearchParameters(sel=self.selector(ids))
+        distances, indices = vector_store.index.search(query, min(k, len(ids)), params=params)
+        results = []
+        for distance, idx in zip(distances[0], indices[0]):
+            if idx == -1:
+                continue
+            doc = vector_store.docstore.search(vector_store.index_to_docstore_id[int(idx)])
+            results.append((doc, float(distance)))
+        return results
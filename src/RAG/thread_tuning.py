@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""多进程部署时的 CPU 线程分配
+
+torch、OpenMP(FAISS 使用)默认各自按全部核心数开线程, 多个工作进程同时运行时线程数远超核心数,
+上下文切换使 embed_query 和相似度检索变慢数倍。这里把核心按进程数平分。
+OMP_NUM_THREADS 等环境变量需要在导入 torch/faiss 之前设置, 运行时再调用 configure_threads 调整。
+"""
+import os
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def threads_per_worker(workers: int, cpus: int = None) -> int:
+    cpus = cpus or os.cpu_count() or 1
+    return max(1, cpus // max(1, workers))
+
+
+def set_thread_env(num_threads: int):
+    """在导入 torch/faiss 之前调用, 已设置的环境变量不覆盖"""
+    for var in THREAD_ENV_VARS:
+        os.environ.setdefault(var, str(num_threads))
+    # tokenizers 的线程池在 fork 后不可用, 且会和 torch 争抢核心
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def configure_threads(num_threads: int):
+    """设置当前进程 torch 和 FAISS 的计算线程数"""
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+    try:
+        import faiss
+        faiss.omp_set_num_threads(num_threads)
+    except ImportError:
+        pass
+    return num_threads
@@ -2,14 +2,56 @@ from typing import *
 from openai import OpenAI
 import json
 import httpx
-from config import API_KEY, DEEPSEEK_API_KEY, MOONSHOT_BASE_URL, DEEPSEEK_API_URL
+import time
+from config import (API_KEY, DEEPSEEK_API_KEY, MOONSHOT_BASE_URL, DEEPSEEK_API_URL, LLM_MAX_CONCURRENCY,
+                    LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_RETRIES, PROMPT_CACHE_ENABLED,
+                    PROMPT_CACHE_TTL, PROMPT_CACHE_MIN_TOKENS, PROMPT_CACHE_MIN_USES, LLM_INPUT_PRICE_PER_M, LLM_CACHED_INPUT_PRICE_PER_M)
+from .llm_scheduler import LLMScheduler
+from .prompt_cache import PromptCache
 
-# 初始化OpenAI客户端
+# 初始化OpenAI客户端; 关闭 SDK 内置重试, 429 等错误只由调度器重试
 client = OpenAI(
     api_key=API_KEY,
     base_url=MOONSHOT_BASE_URL,
+    max_retries=0,
 )
 
+# 所有对话补全请求都经过调度器，统一限流、排队和 429 退避
+scheduler = LLMScheduler(
+    client,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+    max_retries=LLM_MAX_RETRIES,
+)
+
+# 不变的请求前缀通过上下文缓存复用
+prompt_cache = PromptCache(
+    MOONSHOT_BASE_URL,
+    API_KEY,
+    ttl=PROMPT_CACHE_TTL,
+    min_tokens=PROMPT_CACHE_MIN_TOKENS,
+    min_uses=PROMPT_CACHE_MIN_USES,
+    input_price=LLM_INPUT_PRICE_PER_M,
+    cached_price=LLM_CACHED_INPUT_PRICE_PER_M,
+    scheduler=scheduler,
+) if PROMPT_CACHE_ENABLED else None
+
+def chat_completion(priority: str = "interactive", cache_prefix: int = 0, **params):
+    """经调度器调用 client.chat.completions.create，priority 为 interactive 或 batch
+
+    cache_prefix 为请求开头不变的消息条数，这部分连同工具定义通过上下文缓存发送；
+    每次请求都不同的内容（如检索上下文）不要计入
+    """
+    used_cache = False
+    if prompt_cache is not None and cache_prefix:
+        params, used_cache = prompt_cache.apply(params, cache_prefix)
+    start = time.perf_counter()
+    completion = scheduler.create(priority, **params)
+    if prompt_cache is not None:
+        prompt_cache.record(completion, time.perf_counter() - start, used_cache)
+    return completion
+
 # 定义工具列表
 tools = [
     {
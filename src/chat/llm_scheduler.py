@@ -0,0 +1,230 @@
+from typing import *
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+# 优先级数值越小越先执行
+PRIORITIES = {
+    "interactive": 0,  # 页面上的 /ask 请求
+    "batch": 10,       # 批量评测等离线任务
+}
+
+class TokenBucket:
+    """令牌桶，按每分钟速率匀速补充"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """取得 amount 个令牌还需等待的秒数"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        # 允许变为负数，用于按实际用量修正预估
+        self._refill()
+        self.tokens -= amount
+
+def estimate_request_tokens(params: Dict[str, Any], output_reserve: int = 512) -> int:
+    """粗略估算一次请求消耗的 token 数（中文约每字 1 token，图片按 1000 计）"""
+    total = output_reserve
+    for msg in params.get("messages", []):
+        content = msg.get("content") if isinstance(msg, dict) else getattr(msg, "content", None)
+        if isinstance(content, str):
+            total += len(content)
+        elif isinstance(content, list):
+            for item in content:
+                if item.get("type") == "text":
+                    total += len(item.get("text", ""))
+                elif item.get("type") == "image_url":
+                    total += 1000
+    return total
+
+def _status_code(error: Exception) -> Optional[int]:
+    # OpenAI SDK 的异常带 status_code, httpx 的 HTTPStatusError 只在 response 上有
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def _is_rate_limited(error: Exception) -> bool:
+    return _status_code(error) == 429
+
+def _is_transient(error: Exception) -> bool:
+    # 连接失败、超时和服务端错误, 与 OpenAI SDK 默认重试的范围一致; TransportError 为 httpx 的连接和超时错误
+    if any(cls.__name__ in ("APIConnectionError", "APITimeoutError", "TransportError") for cls in type(error).__mro__):
+        return True
+    return _status_code(error) in (408, 409, 500, 502, 503, 504)
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class LLMScheduler:
+    """外部大模型调用的并发限制与优先级调度
+
+    - 按每分钟请求数、每分钟 token 数做令牌桶限流
+    - 同时进行的请求数不超过 max_concurrency
+    - 排队时优先级高的请求先执行，同优先级先到先得
+    - 收到 429 时按 Retry-After 或指数退避重试，并暂停所有请求的发送
+    - 连接失败和服务端错误只重试当前请求，不暂停其他请求
+
+    客户端须设置 max_retries=0，重试只在调度器中进行，否则 SDK 会在限流退避之前自行重发 429 的请求
+    """
+
+    def __init__(self, client, max_concurrency: int = 4, requests_per_minute: int = 60,
+                 tokens_per_minute: int = 120000, max_retries: int = 5, base_backoff: float = 1.0):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._waiting = []  # 堆，元素为 (优先级, 序号)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._wait_times = []  # 最近的排队耗时（秒）
+        self.stats = {"requests": 0, "rate_limited": 0, "retries": 0, "failed": 0}
+        if hasattr(os, "register_at_fork"):  # Windows 不支持 fork
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # 每个进程独立限流, 部署多个进程时应按进程数分摊 rpm/tpm
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._in_flight = 0
+
+    # -------- 排队 --------
+    def _acquire(self, priority: str, tokens: int) -> float:
+        entry = (PRIORITIES.get(priority, PRIORITIES["batch"]), next(self._seq))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            while True:
+                timeout = None
+                if self._waiting[0] == entry and self._in_flight < self.max_concurrency:
+                    timeout = max(
+                        self._paused_until - time.monotonic(),
+                        self.request_bucket.wait_time(1),
+                        self.token_bucket.wait_time(tokens),
+                    )
+                    if timeout <= 0:
+                        heapq.heappop(self._waiting)
+                        self._in_flight += 1
+                        self.request_bucket.consume(1)
+                        self.token_bucket.consume(tokens)
+                        # 队首变化，唤醒下一个等待者检查自己是否可以执行
+                        self._cond.notify_all()
+                        break
+                self._cond.wait(timeout)
+            waited = time.monotonic() - start
+            self._wait_times.append(waited)
+            del self._wait_times[:-500]
+            return waited
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _pause(self, seconds: float):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _acquire_retry(self, tokens: int):
+        # 重试同样计入每分钟请求数和 token 数, 已占用的并发名额保持不变
+        with self._cond:
+            while True:
+                timeout = max(
+                    self._paused_until - time.monotonic(),
+                    self.request_bucket.wait_time(1),
+                    self.token_bucket.wait_time(tokens),
+                )
+                if timeout <= 0:
+                    self.request_bucket.consume(1)
+                    self.token_bucket.consume(tokens)
+                    return
+                self._cond.wait(timeout)
+
+    def _count(self, name: str):
+        with self._cond:
+            self.stats[name] += 1
+
+    # -------- 调用 --------
+    def create(self, priority: str = "interactive", **params):
+        """排队后调用 client.chat.completions.create，参数与其一致"""
+        estimated = estimate_request_tokens(params)
+        completion = self.run(lambda: self.client.chat.completions.create(**params), estimated, priority)
+        # 按实际用量修正 token 桶
+        usage = getattr(completion, "usage", None)
+        actual = getattr(usage, "total_tokens", None)
+        if actual:
+            with self._cond:
+                self.token_bucket.consume(actual - estimated)
+        return completion
+
+    def run(self, call: Callable[[], Any], tokens: int, priority: str = "interactive") -> Any:
+        """排队后执行 call()，与对话补全共用限流、并发名额、429 暂停和重试
+
+        用于缓存创建等同样消耗接口配额、但不经过 chat.completions 的请求, tokens 为预估消耗的 token 数
+        """
+        self._acquire(priority, tokens)
+        self._count("requests")
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return call()
+                except Exception as e:
+                    rate_limited = _is_rate_limited(e)
+                    if not (rate_limited or _is_transient(e)) or attempt >= self.max_retries:
+                        self._count("failed")
+                        raise
+                    self._count("retries")
+                    delay = _retry_after(e) or self.base_backoff * (2 ** attempt) * (0.5 + random.random())
+                    attempt += 1
+                    if rate_limited:
+                        self._count("rate_limited")
+                        self._pause(delay)
+                    time.sleep(delay)
+                    self._acquire_retry(tokens)
+        finally:
+            self._release()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = {}
+            for priority_value, _ in self._waiting:
+                name = next((k for k, v in PRIORITIES.items() if v == priority_value), str(priority_value))
+                depth[name] = depth.get(name, 0) + 1
+            waits = sorted(self._wait_times)
+            return dict(
+                self.stats,
+                queue_depth=len(self._waiting),
+                queue_depth_by_priority=depth,
+                in_flight=self._in_flight,
+                max_concurrency=self.max_concurrency,
+                wait_avg_ms=sum(waits) / len(waits) * 1000 if waits else 0,
+                wait_p95_ms=waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000 if waits else 0,
+                paused_for_s=max(0.0, self._paused_until - time.monotonic()),
+            )
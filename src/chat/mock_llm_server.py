@@ -0,0 +1,174 @@
+"""本地模拟的 OpenAI 兼容接口，用于在不访问 Moonshot 的情况下测试限流与调度
+
+    python mock_llm_server.py --port 8001 --latency 0.5 --rpm 20
+    MOONSHOT_BASE_URL=http://127.0.0.1:8001/v1 python app.py
+
+超过 --rpm 时返回 429 并带 Retry-After 头，与真实接口的限流行为一致。
+同时模拟上下文缓存接口（POST/GET /v1/caching），请求中 role 为 cache 的消息引用已创建的缓存，
+缓存部分计入 usage.cached_tokens；--latency-per-1k 为每千个未缓存输入 token 增加的延迟。
+"""
+from typing import *
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MockState:
+    def __init__(self, latency: float, rpm: int, latency_per_1k: float = 0.0):
+        self.latency = latency
+        self.rpm = rpm
+        self.latency_per_1k = latency_per_1k
+        self.lock = threading.Lock()
+        self.recent = deque()  # 最近一分钟内的请求时间
+        self.caches: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"requests": 0, "rate_limited": 0, "max_concurrent": 0, "caches": 0, "cached_requests": 0}
+        self.concurrent = 0
+
+    def admit(self) -> Optional[float]:
+        """允许请求时返回 None，否则返回建议的重试秒数"""
+        now = time.monotonic()
+        with self.lock:
+            while self.recent and now - self.recent[0] >= 60:
+                self.recent.popleft()
+            if self.rpm and len(self.recent) >= self.rpm:
+                self.stats["rate_limited"] += 1
+                return max(0.1, 60 - (now - self.recent[0]))
+            self.recent.append(now)
+            self.stats["requests"] += 1
+            return None
+
+def count_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(m.get("content")) for m in messages if isinstance(m.get("content"), str))
+
+def resolve_cache(state: MockState, messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int, Any]:
+    """把开头的 cache 消息展开为缓存的消息，返回 (完整消息, 缓存的 token 数, 缓存的工具定义)"""
+    if not messages or messages[0].get("role") != "cache":
+        return messages, 0, None
+    fields = dict(part.split("=", 1) for part in messages[0].get("content", "").split(";") if "=" in part)
+    cache = state.caches.get(fields.get("cache_id"))
+    if cache is None:
+        raise KeyError(fields.get("cache_id"))
+    return cache["messages"] + messages[1:], cache["tokens"], cache.get("tools")
+
+def make_completion(request: Dict[str, Any], cached_tokens: int = 0) -> Dict[str, Any]:
+    messages = request.get("messages", [])
+    last = messages[-1] if messages else {}
+    content = last.get("content") if isinstance(last.get("content"), str) else "[image]"
+    prompt_tokens = count_tokens(messages)
+    answer = f"模拟回答: {content[:50]}"
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": answer},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(answer),
+            "total_tokens": prompt_tokens + len(answer),
+            "cached_tokens": cached_tokens,
+        },
+    }
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, state.stats)
+            elif "/caching/" in self.path:
+                cache = state.caches.get(self.path.rsplit("/", 1)[-1])
+                if cache is None:
+                    self._send(404, {"error": {"message": "cache not found"}})
+                else:
+                    self._send(200, {k: v for k, v in cache.items() if k not in ("messages", "tools")})
+            else:
+                self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.endswith("/caching"):
+                cache = {
+                    "id": f"cache-{uuid.uuid4().hex[:12]}",
+                    "object": "context_cache.object",
+                    "status": "ready",
+                    "model": request.get("model"),
+                    "tokens": count_tokens(request.get("messages", [])) + len(json.dumps(request.get("tools") or [], ensure_ascii=False)),
+                    "messages": request.get("messages", []),
+                    "tools": request.get("tools"),
+                }
+                with state.lock:
+                    state.caches[cache["id"]] = cache
+                    state.stats["caches"] += 1
+                self._send(200, {k: v for k, v in cache.items() if k not in ("messages", "tools")})
+                return
+            if not self.path.endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+            retry_after = state.admit()
+            if retry_after is not None:
+                self._send(429, {"error": {"message": "rate limit exceeded", "type": "rate_limit_reached_error"}},
+                           {"Retry-After": f"{retry_after:.1f}"})
+                return
+            with state.lock:
+                state.concurrent += 1
+                state.stats["max_concurrent"] = max(state.stats["max_concurrent"], state.concurrent)
+            try:
+                try:
+                    messages, cached_tokens, cached_tools = resolve_cache(state, request.get("messages", []))
+                except KeyError:
+                    self._send(400, {"error": {"message": "cache not found", "type": "invalid_request_error"}})
+                    return
+                if cached_tokens:
+                    with state.lock:
+                        state.stats["cached_requests"] += 1
+                request["messages"] = messages
+                if cached_tools and not request.get("tools"):
+                    request["tools"] = cached_tools
+                # 只有未缓存的输入需要重新处理
+                uncached = count_tokens(messages) - cached_tokens
+                time.sleep(state.latency + state.latency_per_1k * uncached / 1000)
+                self._send(200, make_completion(request, cached_tokens))
+            finally:
+                with state.lock:
+                    state.concurrent -= 1
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def serve(port: int = 8001, latency: float = 0.5, rpm: int = 0, latency_per_1k: float = 0.0) -> ThreadingHTTPServer:
+    """在后台线程启动模拟服务器并返回，便于在脚本中使用"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(MockState(latency, rpm, latency_per_1k)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模拟的 OpenAI 兼容接口")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="每个请求的模拟延迟(秒)")
+    parser.add_argument("--rpm", type=int, default=0, help="每分钟允许的请求数, 0 表示不限")
+    parser.add_argument("--latency-per-1k", type=float, default=0.0, help="每千个未缓存输入 token 增加的延迟(秒)")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                 make_handler(MockState(args.latency, args.rpm, args.latency_per_1k)))
+    print(f"模拟服务器运行在 http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,244 @@
+from typing import *
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from .llm_scheduler import estimate_request_tokens
+
+class PromptCache:
+    """使用 Moonshot 上下文缓存(Context Caching)复用不变的请求前缀
+
+    请求开头不变的若干条消息(系统提示、历史对话)连同工具定义作为前缀创建缓存,
+    之后相同前缀的请求改为发送一条 role 为 cache 的消息引用缓存, 只发送前缀之后的消息, 不再发送工具定义。
+    前缀按内容哈希查找, 多轮对话时使用已缓存的最长前缀。每个问题都不同的内容(如检索上下文)不应放在前缀中。
+
+    同一前缀出现 min_uses 次后才创建缓存, 创建在后台线程中进行, 不阻塞请求; 创建完成之前的请求照常发送完整内容。
+    创建请求经调度器发送, 与对话补全共用限流和 429 暂停。接口不支持或创建失败时在 cooldown 秒内不再尝试。
+
+    短于 min_tokens 的前缀不缓存: 缓存的创建、存储和调用都另外计费, 短前缀节省的输入费用抵不过这些开销。
+    网页问答的前缀只有系统提示和工具定义(约 700 token), 默认配置下不会被缓存, 只有较长的多轮对话历史能用上缓存。
+
+    Args:
+        base_url, api_key: 与对话补全相同的接口地址和密钥
+        scheduler: 发送缓存创建请求的 LLMScheduler, 为 None 时直接发送(不限流)
+        model: 缓存所属的模型系列
+        ttl: 缓存有效期(秒), 每次使用时重置
+        min_tokens: 前缀估算 token 数达到该值才创建缓存
+        min_uses: 前缀出现的次数达到该值才创建缓存
+        input_price, cached_price: 每百万输入 token 的价格, 用于估算节省的费用
+    """
+
+    def __init__(self, base_url: str, api_key: str, model: str = "moonshot-v1", ttl: int = 3600,
+                 min_tokens: int = 1024, min_uses: int = 2, input_price: float = 12.0, cached_price: float = 1.2,
+                 cooldown: float = 600, max_entries: int = 256, ready_timeout: float = 60, scheduler=None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.scheduler = scheduler
+        self.model = model
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.min_uses = min_uses
+        self.ready_timeout = ready_timeout
+        self.input_price = input_price
+        self.cached_price = cached_price
+        self.cooldown = cooldown
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._caches: Dict[str, Dict[str, Any]] = {}  # 前缀哈希 -> {"id", "length", "tools", "expires"}
+        self._seen: Dict[str, int] = {}  # 尚未缓存的前缀哈希 -> 出现次数
+        self._pending: Set[str] = set()  # 正在创建缓存的前缀哈希
+        self._small: Dict[str, int] = {}  # 短于 min_tokens 的前缀哈希 -> 估算 token 数, 不再重复估算
+        self._disabled_until = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-cache")
+        self.stats = {
+            "requests": 0, "cache_hits": 0, "caches_created": 0, "create_failures": 0,
+            "skipped_small": 0,  # 因短于 min_tokens 未缓存的请求数
+            "cached_tokens": 0, "uncached_tokens": 0, "cache_creation_tokens": 0,
+            "latency_cached_s": 0.0, "latency_uncached_s": 0.0,
+        }
+        if hasattr(os, "register_at_fork"):  # Windows 不支持 fork
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # 服务端缓存仍然有效, 重建锁和后台线程; 父进程中正在创建的缓存不会在子进程中完成
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-cache")
+
+    # -------- 前缀 --------
+    @staticmethod
+    def _as_dict(message: Any) -> Dict[str, Any]:
+        # 多轮对话中模型返回的消息对象
+        return message if isinstance(message, dict) else message.model_dump(exclude_none=True)
+
+    @staticmethod
+    def _prefix_keys(messages: List[Dict[str, Any]], length: int, tools: Optional[List[Dict[str, Any]]] = None) -> List[str]:
+        """依次返回工具定义加前 1..length 条消息的哈希"""
+        keys, h = [], hashlib.sha256()
+        h.update(json.dumps(tools or [], ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        for msg in messages[:length]:
+            h.update(json.dumps(msg, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+            keys.append(h.hexdigest())
+        return keys
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def _post_caching(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with httpx.Client(timeout=30) as client:
+            r = client.post(f"{self.base_url}/caching", headers=self._headers(), json=body)
+            r.raise_for_status()
+            return r.json()
+
+    def _create(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None,
+                tokens: int = 0) -> Dict[str, Any]:
+        body = {"model": self.model, "messages": messages, "ttl": self.ttl}
+        if tools:
+            body["tools"] = tools
+        if self.scheduler is None:
+            return self._post_caching(body)
+        # 缓存创建按前缀 token 数计费和限流, 排在页面请求之后
+        return self.scheduler.run(lambda: self._post_caching(body), tokens, priority="batch")
+
+    def _refresh(self, cache_id: str) -> Dict[str, Any]:
+        # 只查询状态, 不消耗 token, 不经过调度器
+        with httpx.Client(timeout=10) as client:
+            r = client.get(f"{self.base_url}/caching/{cache_id}", headers=self._headers())
+            r.raise_for_status()
+            return r.json()
+
+    def _lookup(self, keys: List[str]) -> Optional[Dict[str, Any]]:
+        """返回可用的最长前缀缓存, 只查本地记录, 不访问网络"""
+        now = time.monotonic()
+        with self._lock:
+            for key in reversed(keys):
+                entry = self._caches.get(key)
+                if entry is not None and entry["expires"] > now:
+                    entry["expires"] = now + self.ttl
+                    return entry
+        return None
+
+    def _maybe_create(self, key: str, prefix: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]]):
+        """记录前缀出现的次数, 达到 min_uses 时在后台创建缓存; 同一前缀同时只创建一次"""
+        with self._lock:
+            if key in self._small:
+                self.stats["skipped_small"] += 1
+                return
+            if key in self._caches or key in self._pending or time.monotonic() < self._disabled_until:
+                return
+            uses = self._seen.pop(key, 0) + 1
+            if uses < self.min_uses:
+                self._seen[key] = uses
+                # 只保留最近出现的前缀
+                while len(self._seen) > self.max_entries * 4:
+                    self._seen.pop(next(iter(self._seen)))
+                return
+            self._pending.add(key)
+        tokens = estimate_request_tokens({"messages": prefix}, output_reserve=0)
+        if tools:
+            tokens += len(json.dumps(tools, ensure_ascii=False))
+        if tokens < self.min_tokens:
+            with self._lock:
+                self._pending.discard(key)
+                self.stats["skipped_small"] += 1
+                self._small[key] = tokens
+                while len(self._small) > self.max_entries:
+                    self._small.pop(next(iter(self._small)))
+            return
+        self._executor.submit(self._create_entry, key, prefix, tools, tokens)
+
+    def _create_entry(self, key: str, prefix: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]], tokens: int):
+        try:
+            cache = self._create(prefix, tools, tokens)
+            # 服务端可能需要一段时间准备缓存, 就绪后才供请求使用
+            deadline = time.monotonic() + self.ready_timeout
+            while cache.get("status", "ready") != "ready":
+                if cache.get("status") in ("error", "inactive") or time.monotonic() > deadline:
+                    raise RuntimeError(f"缓存 {cache.get('id')} 状态为 {cache.get('status')}")
+                time.sleep(1)
+                cache = dict(cache, **self._refresh(cache["id"]))
+        except Exception as e:
+            with self._lock:
+                self._pending.discard(key)
+                self.stats["create_failures"] += 1
+                self._disabled_until = time.monotonic() + self.cooldown
+            print(f"创建上下文缓存失败, {self.cooldown:.0f}s 内不再尝试: {e}")
+            return
+        with self._lock:
+            self._pending.discard(key)
+            self._caches[key] = {"id": cache["id"], "length": len(prefix), "tools": bool(tools),
+                                 "expires": time.monotonic() + self.ttl}
+            self.stats["caches_created"] += 1
+            self.stats["cache_creation_tokens"] += cache.get("tokens") or tokens
+            # 超出数量时丢弃最早创建的记录, 服务端缓存按 ttl 自然过期
+            while len(self._caches) > self.max_entries:
+                self._caches.pop(next(iter(self._caches)))
+
+    # -------- 请求 --------
+    def apply(self, params: Dict[str, Any], prefix_length: int) -> Tuple[Dict[str, Any], bool]:
+        """把前 prefix_length 条消息及工具定义替换为缓存引用, 返回 (新参数, 是否使用了缓存)"""
+        messages = params.get("messages", [])
+        prefix_length = min(prefix_length, len(messages))
+        if prefix_length <= 0:
+            return params, False
+        messages = [self._as_dict(m) for m in messages[:prefix_length]] + list(messages[prefix_length:])
+        tools = params.get("tools")
+        keys = self._prefix_keys(messages, prefix_length, tools)
+        entry = self._lookup(keys)
+        if entry is None or entry["length"] < prefix_length:
+            # 尚未缓存的前缀先按完整请求发送, 多次出现后在后台创建缓存
+            self._maybe_create(keys[-1], messages[:prefix_length], tools)
+        if entry is None:
+            return params, False
+        cache_message = {"role": "cache", "content": f"cache_id={entry['id']};reset_ttl={self.ttl}"}
+        params = dict(params, messages=[cache_message] + list(messages[entry["length"]:]))
+        if entry["tools"]:
+            params.pop("tools", None)
+        return params, True
+
+    def record(self, completion, latency: float, used_cache: bool):
+        """按补全结果的 usage 统计缓存命中的 token 数和耗时"""
+        usage = getattr(completion, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        cached = getattr(usage, "cached_tokens", None)
+        if cached is None:
+            # OpenAI 格式
+            cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0)
+        cached = cached or 0
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["cached_tokens"] += cached
+            self.stats["uncached_tokens"] += max(0, prompt_tokens - cached)
+            if used_cache and cached:
+                self.stats["cache_hits"] += 1
+                self.stats["latency_cached_s"] += latency
+            else:
+                self.stats["latency_uncached_s"] += latency
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            active = len(self._caches)
+            pending = len(self._pending)
+            small = max(self._small.values(), default=0)
+        hits, misses = stats["cache_hits"], stats["requests"] - stats["cache_hits"]
+        total = stats["cached_tokens"] + stats["uncached_tokens"]
+        baseline = total * self.input_price / 1e6
+        actual = ((stats["uncached_tokens"] + stats["cache_creation_tokens"]) * self.input_price
+                  + stats["cached_tokens"] * self.cached_price) / 1e6
+        return dict(
+            stats,
+            active_caches=active,
+            pending_caches=pending,
+            min_tokens=self.min_tokens,
+            largest_skipped_prefix_tokens=small,
+            cached_token_ratio=stats["cached_tokens"] / total if total else 0.0,
+            latency_cached_avg_s=stats["latency_cached_s"] / hits if hits else 0.0,
+            latency_uncached_avg_s=stats["latency_uncached_s"] / misses if misses else 0.0,
+            input_cost=actual,
+            input_cost_without_cache=baseline,
+            cost_saved=baseline - actual,
+        )
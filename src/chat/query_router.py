@@ -0,0 +1,219 @@
+"""本地查询路由：判断一个问题是否需要 RAG 检索、DeepSeek 知识库工具和语音合成
+
+先按关键词规则判断，规则无法确定时用最近质心分类：把问题的嵌入向量与各类示例问题的平均向量比较。
+嵌入使用 RAG 已加载的模型，不额外调用大模型；未开启深度搜索的请求只用关键词规则，不为路由加载嵌入模型。
+闲聊问题不提供知识库工具；只有按关键词规则确定的问候语才跳过深度搜索的 RAG 检索，质心分类的结果不足以推翻用户的选择。
+路由结果、请求最终的耗时、token 用量和是否实际检索写入 JSONL 日志，可用 summarize_log 按类别统计。
+"""
+from typing import *
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+# 路由类别
+CHITCHAT = "chitchat"  # 问候、闲聊、与超声无关的问题
+DOMAIN = "domain"      # 医学超声专业问题(含超声物理与工程)
+
+GREETING_PATTERN = re.compile(
+    r"^\s*(你好|您好|嗨|哈喽|早上好|下午好|晚上好|谢谢|多谢|感谢|再见|拜拜|好的|收到|"
+    r"hi|hello|hey|thanks|thank you|bye|ok)[\s!！。.~,，?？]*$",
+    re.IGNORECASE,
+)
+TTS_KEYWORDS = ("朗读", "读出来", "读一下", "念出来", "念一下", "播放", "语音", "说出来")
+DOMAIN_KEYWORDS = (
+    "超声", "B超", "彩超", "回声", "探头", "多普勒", "声像", "声窗", "伪像", "切面", "病灶",
+    "结节", "囊肿", "肿块", "血流", "甲状腺", "乳腺", "肝", "胆", "胰", "脾", "肾", "子宫",
+    "卵巢", "胎儿", "心脏", "血管", "淋巴", "积液", "钙化", "弹性成像", "造影", "TI-RADS", "BI-RADS",
+    # 教材的超声物理与工程部分
+    "压电", "换能器", "声阻抗", "衰减", "声速", "声波", "声束", "声场", "声压", "声强", "声功率",
+    "波长", "频率", "分辨力", "分辨率", "聚焦", "阵元", "阵列", "相控阵", "波束", "近场", "远场",
+    "反射", "折射", "散射", "脉冲", "增益", "动态范围", "帧频", "谐波", "匹配层", "背衬",
+    "混叠", "奈奎斯特", "空化", "机械指数", "热指数", "生物效应",
+)
+
+# 最近质心分类的示例问题
+PROTOTYPES = {
+    CHITCHAT: [
+        "你好，你是谁？",
+        "今天天气怎么样",
+        "给我讲个笑话",
+        "你能做什么",
+        "谢谢你的帮助",
+        "推荐一部电影",
+        "帮我写一首诗",
+        "现在几点了",
+    ],
+    DOMAIN: [
+        "甲状腺结节的超声表现有哪些",
+        "如何区分囊性和实性肿块",
+        "彩色多普勒如何评估血流",
+        "肝脏弥漫性病变的声像图特点",
+        "乳腺肿块 BI-RADS 分级标准",
+        "低回声病灶的鉴别诊断",
+        "超声探头频率如何选择",
+        "胎儿颈项透明层厚度的测量方法",
+        "压电效应的原理是什么",
+        "声阻抗差异如何影响界面反射",
+        "换能器匹配层的作用",
+        "组织对声能的衰减与哪些因素有关",
+    ],
+}
+
+
+class QueryRouter:
+    """
+    Args:
+        embed_query: 返回问题嵌入向量的函数, 为 None 时只使用关键词规则
+        embed_documents: 批量嵌入示例问题的函数, 用于计算各类质心
+        log_path: 路由日志(JSONL)路径, 为 None 时不记录
+        margin: 两个质心相似度之差小于该值时视为无法判断, 按专业问题处理
+        skip_greeting_retrieval: 为 True 时按关键词识别的问候语不需要 RAG 检索
+    """
+
+    def __init__(self, embed_query: Optional[Callable[[str], List[float]]] = None,
+                 embed_documents: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 log_path: Optional[str] = None, margin: float = 0.02, skip_greeting_retrieval: bool = True):
+        self.embed_query = embed_query
+        self.embed_documents = embed_documents
+        self.log_path = log_path
+        self.margin = margin
+        self.skip_greeting_retrieval = skip_greeting_retrieval
+        self._centroids = None
+        self._lock = threading.Lock()
+        self.stats = {"routed": 0, "keyword": 0, "centroid": 0, "default": 0,
+                      "chitchat": 0, "skipped_tools": 0, "skipped_retrieval": 0}
+
+    def _get_centroids(self) -> Dict[str, np.ndarray]:
+        with self._lock:
+            if self._centroids is None:
+                labels = list(PROTOTYPES)
+                texts = [t for label in labels for t in PROTOTYPES[label]]
+                vectors = np.asarray(self.embed_documents(texts), dtype="float32")
+                centroids, start = {}, 0
+                for label in labels:
+                    count = len(PROTOTYPES[label])
+                    centroid = vectors[start:start + count].mean(axis=0)
+                    centroids[label] = centroid / (np.linalg.norm(centroid) or 1.0)
+                    start += count
+                self._centroids = centroids
+            return self._centroids
+
+    def _classify(self, text: str, use_embeddings: bool = True) -> Tuple[str, str, Optional[float]]:
+        """返回 (类别, 依据, 相似度差)"""
+        if GREETING_PATTERN.match(text):
+            return CHITCHAT, "keyword", None
+        if any(keyword.lower() in text.lower() for keyword in DOMAIN_KEYWORDS):
+            return DOMAIN, "keyword", None
+        if not use_embeddings or self.embed_query is None or self.embed_documents is None:
+            return DOMAIN, "default", None
+        try:
+            centroids = self._get_centroids()
+            vector = np.asarray(self.embed_query(text), dtype="float32")
+            vector /= np.linalg.norm(vector) or 1.0
+        except Exception as e:
+            print(f"查询路由嵌入失败, 按默认处理: {e}")
+            return DOMAIN, "default", None
+        scores = {label: float(vector @ centroid) for label, centroid in centroids.items()}
+        diff = scores[DOMAIN] - scores[CHITCHAT]
+        if abs(diff) < self.margin:
+            # 无法判断时保守处理, 保留检索和工具
+            return DOMAIN, "default", diff
+        return (DOMAIN if diff > 0 else CHITCHAT), "centroid", diff
+
+    def route(self, text: str, use_embeddings: bool = True) -> Dict[str, Any]:
+        """
+        use_embeddings 为 False 时规则无法确定的问题按专业问题处理, 不调用嵌入模型
+
+        返回路由结果:
+            route: 类别; reason: keyword / centroid / default
+            retrieval: 是否需要 RAG 检索, 只有按关键词识别的问候语为 False; tools: 需要提供给模型的工具名
+        """
+        start = time.perf_counter()
+        label, reason, margin = self._classify(text, use_embeddings)
+        tools = []
+        if label == DOMAIN:
+            tools.append("query_ultrasound_knowledge")
+        if any(keyword in text for keyword in TTS_KEYWORDS):
+            tools.append("text_to_speech")
+        decision = {
+            "route": label,
+            "reason": reason,
+            "margin": margin,
+            "retrieval": not (self.skip_greeting_retrieval and label == CHITCHAT and reason == "keyword"),
+            "tools": tools,
+            "router_ms": (time.perf_counter() - start) * 1000,
+        }
+        with self._lock:
+            self.stats["routed"] += 1
+            self.stats[reason] += 1
+            self.stats["chitchat"] += label == CHITCHAT
+            self.stats["skipped_tools"] += not tools
+        return decision
+
+    def record_skipped_retrieval(self):
+        """调用方按 retrieval 跳过了用户开启的深度搜索检索时计数"""
+        with self._lock:
+            self.stats["skipped_retrieval"] += 1
+
+    def log(self, text: str, decision: Dict[str, Any], trace: Dict[str, Any]):
+        """记录一次请求的路由结果及最终耗时、token 用量"""
+        if not self.log_path:
+            return
+        record = {
+            "time": time.time(),
+            "question": text,
+            **decision,
+            "timings": trace.get("timings", {}),
+            "usage": trace.get("usage", {}),
+            "tools_called": trace.get("tools", []),
+            "retrieved": "rag" in trace.get("timings", {}),
+        }
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
+
+
+def summarize_log(log_path: str) -> Dict[str, Any]:
+    """按类别统计日志中的平均耗时、token 用量、检索比例和工具调用轮次比例
+
+    两个类别的问题本身不同, 类别之间的差值不能当作路由的收益; 要衡量收益, 应对同一批问题分别在开启和关闭路由
+    (QUERY_ROUTER_ENABLED) 时记录并比较。
+    """
+    groups: Dict[str, Dict[str, float]] = {}
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            group = groups.setdefault(record["route"], {"count": 0, "latency_s": 0.0, "total_tokens": 0,
+                                                        "tool_rounds": 0, "retrieved": 0})
+            group["count"] += 1
+            group["latency_s"] += sum(record["timings"].values())
+            group["total_tokens"] += record["usage"].get("total_tokens", 0)
+            group["tool_rounds"] += "completion_2" in record["timings"]
+            group["retrieved"] += record.get("retrieved", "rag" in record["timings"])
+    for group in groups.values():
+        for key in ("latency_s", "total_tokens", "tool_rounds", "retrieved"):
+            group[f"avg_{key}"] = group[key] / group["count"]
+    return groups
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="统计查询路由日志")
+    parser.add_argument("log", help="路由日志(JSONL)")
+    args = parser.parse_args()
+    for route, group in summarize_log(args.log).items():
+        print(f"{route:<9} {group['count']} 次  平均耗时 {group['avg_latency_s']:.2f}s  "
+              f"平均 token {group['avg_total_tokens']:.0f}  检索比例 {group['avg_retrieved']:.0%}  "
+              f"工具调用轮次比例 {group['avg_tool_rounds']:.0%}")
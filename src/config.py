@@ -13,4 +13,19 @@ VOICE_NAME = "zh-CN-XiaoxiaoNeural"
 
 # API URL配置
 DEEPSEEK_API_URL = "https://api.deepseek.com/v1/medical/ultrasound"
-MOONSHOT_BASE_URL = "https://api.moonshot.cn/v1"
\ No newline at end of file
+MOONSHOT_BASE_URL = os.getenv("MOONSHOT_BASE_URL", "https://api.moonshot.cn/v1")  # 可指向本地模拟服务器
+
+# 大模型调用调度配置
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 4))  # 同时进行的请求数
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 60))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 120000))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))  # 429 时的最大重试次数
+
+# 上下文缓存配置: 复用系统提示、历史对话等不变的请求前缀
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "1") == "1"
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", 3600))  # 缓存有效期(秒)
+# 前缀达到该 token 数才创建缓存; 网页问答的前缀(系统提示和工具定义)约 700 token, 默认不缓存, 只有较长的对话历史会缓存
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", 1024))
+PROMPT_CACHE_MIN_USES = int(os.getenv("PROMPT_CACHE_MIN_USES", 2))  # 同一前缀出现该次数后才创建缓存
+LLM_INPUT_PRICE_PER_M = float(os.getenv("LLM_INPUT_PRICE_PER_M", 12.0))  # 每百万输入 token 价格(元), 用于估算节省
+LLM_CACHED_INPUT_PRICE_PER_M = float(os.getenv("LLM_CACHED_INPUT_PRICE_PER_M", 1.2))  # 命中缓存的输入 token 价格
\ No newline at end of file
@@ -1 +1 @@
-from .image_service import encode_image_to_base64, has_image_content
\ No newline at end of file
+from .image_service import encode_image_to_base64, encode_bytes_to_base64, has_image_content
\ No newline at end of file
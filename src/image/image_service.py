@@ -24,9 +24,12 @@ def encode_image_to_base64(image_path: str) -> str:
         image_data = f.read()
     
     file_ext = os.path.splitext(image_path)[1][1:]  # 获取扩展名（去掉点）
+    return encode_bytes_to_base64(image_data, file_ext)
+
+def encode_bytes_to_base64(image_data: bytes, file_ext: str = "png") -> str:
+    """将已读取的图像数据编码为base64格式"""
     if not file_ext:
         file_ext = "png"  # 默认扩展名
-    
     return f"data:image/{file_ext};base64,{base64.b64encode(image_data).decode('utf-8')}"
 
 def has_image_content(messages: List[Dict]) -> bool:
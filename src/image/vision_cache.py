@@ -0,0 +1,154 @@
+from typing import *
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+
+def normalize_prompt(prompt: str) -> str:
+    """规范化提示词，使空白和全半角差异不影响缓存命中"""
+    prompt = unicodedata.normalize("NFKC", prompt or "")
+    return re.sub(r"\s+", " ", prompt).strip()
+
+def hash_image_bytes(image_data: bytes) -> str:
+    """计算图像内容哈希"""
+    return hashlib.sha256(image_data).hexdigest()
+
+class VisionCache:
+    """图像分析结果的持久化缓存
+
+    键为 (图像内容哈希, 规范化提示词, 模型, 温度)，按 LRU 和 TTL 淘汰；
+    相同键的并发请求只会触发一次模型调用。
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 2000, ttl_seconds: int = 30 * 24 * 3600):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vision_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON vision_cache(accessed)")
+        self._conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        if hasattr(os, "register_at_fork"):  # Windows 不支持 fork
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # SQLite 连接不能跨 fork 使用, 子进程重新打开
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+
+    @staticmethod
+    def make_key(image_hash: str, prompt: str, model: str, temperature: float) -> str:
+        raw = json.dumps([image_hash, normalize_prompt(prompt), model, round(float(temperature), 3)],
+                         ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM vision_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if now - created >= self.ttl_seconds:
+                self._conn.execute("DELETE FROM vision_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats["evictions"] += 1
+                return None
+            self._conn.execute("UPDATE vision_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO vision_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            # 超出容量时淘汰最久未使用的条目
+            count = self._conn.execute("SELECT COUNT(*) FROM vision_cache").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM vision_cache WHERE key IN "
+                    "(SELECT key FROM vision_cache ORDER BY accessed ASC LIMIT ?)", (excess,)
+                )
+                self.stats["evictions"] += excess
+            self._conn.commit()
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        """命中则直接返回；否则由第一个请求计算，其余相同请求等待其结果"""
+        value = self.get(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            # 失败结果不缓存，等待中的请求同样收到异常
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def info(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM vision_cache").fetchone()[0]
+        return dict(self.stats, entries=entries, max_entries=self.max_entries)
+
+def prewarm(cache: VisionCache, image_paths: List[str], prompts: List[str],
+            analyze: Callable[[str, str], str]) -> Dict[str, int]:
+    """为精选图像集预先填充缓存
+
+    Args:
+        cache: 目标缓存
+        image_paths: 图像文件路径列表
+        prompts: 需要预热的提示词列表
+        analyze: 分析函数，参数为 (图像路径, 提示词)，内部应使用同一缓存
+
+    Returns:
+        已存在和新生成的条目数
+    """
+    before = cache.stats["hits"]
+    done, failed = 0, 0
+    for path in image_paths:
+        for prompt in prompts:
+            try:
+                analyze(path, prompt)
+                done += 1
+            except Exception as e:
+                print(f"预热失败 {path}: {e}")
+                failed += 1
+    cached = cache.stats["hits"] - before
+    return {"cached": cached, "generated": done - cached, "failed": failed}
@@ -1,7 +1,7 @@
 from typing import *
 import json
 import asyncio
-from chat.chat_service import client, tools, tool_map
+from chat.chat_service import chat_completion, tools, tool_map
 from speech.speech_service import text_to_speech
 from image import encode_image_to_base64, has_image_content
 # # 添加项目根目录到Python路径
@@ -33,6 +33,9 @@ async def main():
         
         if choice == "3":
             break
+
+        # 本轮之前的对话历史不再变化, 作为可缓存的请求前缀
+        history_length = len(messages)
         
         if choice == "1":
             user_input = input("请输入您的问题: ")
@@ -102,7 +105,7 @@ async def main():
             if not has_image_content(messages):
                 request_params["tools"] = tools
                 
-            completion = client.chat.completions.create(**request_params)
+            completion = chat_completion(cache_prefix=history_length, **request_params)
             choice = completion.choices[0]
             finish_reason = choice.finish_reason
             print(f"模型返回的finish_reason: {finish_reason}")
@@ -136,6 +139,8 @@ async def main():
                         "content": json.dumps(tool_result),
                     })
 
+        # 回答加入历史, 下一轮请求的前缀与本轮一致
+        messages.append({"role": "assistant", "content": choice.message.content})
         print("\nKimi回答:", choice.message.content)
         print("="*50)
         
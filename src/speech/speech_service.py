@@ -1,36 +1,146 @@
 from typing import *
+import abc
 import asyncio
-import edge_tts
-import pygame
 import io
+import threading
+import time
+import edge_tts
 from config import VOICE_NAME
 
+class Synthesizer(abc.ABC):
+    """语音合成接口，stream 按到达顺序异步产出音频数据块"""
+
+    media_type = "audio/mpeg"
+
+    @abc.abstractmethod
+    def stream(self, text: str) -> AsyncIterator[bytes]:
+        """子类实现为异步生成器"""
+
+class EdgeTTSSynthesizer(Synthesizer):
+    """使用 EdgeTTS 合成 MP3 音频"""
+
+    def __init__(self, voice: str = VOICE_NAME):
+        self.voice = voice
+
+    async def stream(self, text: str) -> AsyncIterator[bytes]:
+        communicate = edge_tts.Communicate(text, self.voice)
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                yield chunk["data"]
+
+class FakeSynthesizer(Synthesizer):
+    """本地模拟的合成器，按固定间隔产出数据块，用于测试和压测，不访问网络"""
+
+    def __init__(self, chunks: int = 10, chunk_size: int = 4096, first_delay: float = 0.2, delay: float = 0.05):
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.first_delay = first_delay
+        self.delay = delay
+
+    async def stream(self, text: str) -> AsyncIterator[bytes]:
+        await asyncio.sleep(self.first_delay)
+        for i in range(self.chunks):
+            if i:
+                await asyncio.sleep(self.delay)
+            yield bytes([i % 256]) * self.chunk_size
+
+class TTSMetrics:
+    """记录流式合成的首字节时间(TTFB)、总耗时和数据量"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._ttfb = []
+        self.stats = {"streams": 0, "in_flight": 0, "errors": 0, "cancelled": 0, "bytes": 0}
+
+    def record(self, key: str, value: int = 1):
+        with self._lock:
+            self.stats[key] += value
+
+    def record_ttfb(self, seconds: float):
+        with self._lock:
+            self._ttfb.append(seconds)
+            del self._ttfb[:-self.window]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            ttfb = sorted(self._ttfb)
+            return dict(
+                self.stats,
+                ttfb_avg_ms=sum(ttfb) / len(ttfb) * 1000 if ttfb else 0,
+                ttfb_p95_ms=ttfb[min(len(ttfb) - 1, int(len(ttfb) * 0.95))] * 1000 if ttfb else 0,
+            )
+
+def iter_audio(synthesizer: Synthesizer, text: str, metrics: Optional[TTSMetrics] = None,
+               start: Optional[float] = None) -> Iterator[bytes]:
+    """在当前线程中同步地逐块产出音频，供 WSGI 流式响应使用
+
+    start 为请求开始的时间(time.perf_counter)，用于计算首字节时间；客户端断开时停止合成。
+    """
+    start = start if start is not None else time.perf_counter()
+    loop = asyncio.new_event_loop()
+    chunks = synthesizer.stream(text)
+    first = True
+    finished = False
+    if metrics:
+        metrics.record("streams")
+        metrics.record("in_flight")
+    try:
+        while True:
+            try:
+                chunk = loop.run_until_complete(chunks.__anext__())
+            except StopAsyncIteration:
+                finished = True
+                break
+            if first and metrics:
+                metrics.record_ttfb(time.perf_counter() - start)
+            first = False
+            if metrics:
+                metrics.record("bytes", len(chunk))
+            yield chunk
+    except GeneratorExit:
+        if metrics:
+            metrics.record("cancelled")
+        raise
+    except Exception:
+        if metrics:
+            metrics.record("errors")
+        raise
+    finally:
+        if not finished:
+            loop.run_until_complete(chunks.aclose())
+        loop.close()
+        if metrics:
+            metrics.record("in_flight", -1)
+
+async def synthesize(text: str, synthesizer: Optional[Synthesizer] = None) -> bytes:
+    """合成完整的音频数据"""
+    synthesizer = synthesizer or EdgeTTSSynthesizer()
+    audio_buffer = io.BytesIO()
+    async for chunk in synthesizer.stream(text):
+        audio_buffer.write(chunk)
+    return audio_buffer.getvalue()
+
 async def text_to_speech(text: str) -> Dict[str, Any]:
-    """使用EdgeTTS将文本转换为语音并直接播放"""
+    """使用EdgeTTS将文本转换为语音并在本机直接播放（命令行程序使用，网页通过 /tts 流式返回音频）"""
     try:
+        # 只有本机播放需要pygame，按需导入
+        import pygame
+
         # 初始化pygame音频系统
         pygame.mixer.init()
-        
-        # 创建TTS通信对象
-        communicate = edge_tts.Communicate(text, VOICE_NAME)
-        
+
         # 创建内存缓冲区存储音频数据
-        audio_buffer = io.BytesIO()
-        async for chunk in communicate.stream():
-            if chunk["type"] == "audio":
-                audio_buffer.write(chunk["data"])
-        
-        # 将缓冲区指针移到开始位置
-        audio_buffer.seek(0)
-        
+        audio_buffer = io.BytesIO(await synthesize(text))
+
         # 使用pygame播放音频
         pygame.mixer.music.load(audio_buffer)
         pygame.mixer.music.play()
-        
+
         # 等待播放完成
         while pygame.mixer.music.get_busy():
             await asyncio.sleep(0.1)
-            
+
         return {"status": "success", "message": "语音播放成功"}
     except Exception as e:
-        return {"error": f"语音合成失败: {str(e)}"}
\ No newline at end of file
+        return {"error": f"语音合成失败: {str(e)}"}
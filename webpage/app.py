@@ -1,7 +1,8 @@
-from flask import Flask, request, jsonify, render_template, url_for
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context, url_for
 from werkzeug.utils import secure_filename
+import hashlib
+import json
 import os
-from uuid import uuid4
 import sys
 from pathlib import Path
 
@@ -9,7 +10,9 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 # 导入自定义服务模块
-from src.chat.chat_service import tool_map as chat_tool_map
+from src.chat.chat_service import tool_map as chat_tool_map, scheduler as llm_scheduler, prompt_cache
+from src.RAG.rag_system import get_rag_system, get_collection_manager
+from src.RAG.ingest_jobs import IngestJobQueue
 
 
 # 初始化Flask应用
@@ -22,6 +25,23 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 最大文件大小16MB
 # 确保上传文件夹存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# 按内容哈希去重保存上传文件，并在后台清理无引用的文件
+from config import UPLOAD_QUOTA_BYTES, UPLOAD_TTL_SECONDS, UPLOAD_GC_INTERVAL, UPLOAD_INDEX_PATH
+from upload_store import UploadStore
+upload_store = UploadStore(app.config['UPLOAD_FOLDER'], UPLOAD_QUOTA_BYTES, UPLOAD_TTL_SECONDS, UPLOAD_INDEX_PATH)
+upload_store.start_gc(UPLOAD_GC_INTERVAL)
+
+def unknown_collections_error(names):
+    # 集合名称由客户端提供, 只接受已建立索引的集合
+    unknown = get_collection_manager().unknown_collections(names or [])
+    if unknown:
+        return jsonify({'error': f"集合不存在: {', '.join(unknown)}"}), 400
+    return None
+
+def get_session_id():
+    # 前端可通过表单字段或请求头传入会话ID，否则按客户端地址区分
+    return request.form.get('session_id') or request.headers.get('X-Session-Id') or request.remote_addr or 'anonymous'
+
 # 文件上传端点
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -32,12 +52,9 @@ def upload_file():
     uploaded_files = []  # 存储上传文件的元数据
     for file in files:
         if file and file.filename:
-            # 确保文件名安全并生成唯一文件名
             original_filename = secure_filename(file.filename)
-            extension = os.path.splitext(original_filename)[1]  # 获取文件扩展名
-            new_filename = str(uuid4()) + extension  # 生成唯一文件名
-            # 保存文件到上传文件夹
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], new_filename))
+            # 流式保存并计算内容哈希，相同内容的文件只保存一份
+            new_filename = upload_store.save(file, get_session_id())
             # 生成文件的访问URL
             file_url = url_for('static', filename='uploads/' + new_filename)
             # 存储原始文件名和URL
@@ -54,11 +71,16 @@ def upload_file():
 tool_map = chat_tool_map.copy()
 
 # 导入页面处理器
-from page_handlers import LearningHandler, UsimageHandler
+from page_handlers import LearningHandler, UsimageHandler, vision_cache, query_router, prefetcher, tts_texts
 
 # 初始化页面处理器
-learning_handler = LearningHandler(app.config['UPLOAD_FOLDER'])
-usimage_handler = UsimageHandler(app.config['UPLOAD_FOLDER'])
+learning_handler = LearningHandler(app.config['UPLOAD_FOLDER'], upload_store)
+usimage_handler = UsimageHandler(app.config['UPLOAD_FOLDER'], upload_store)
+
+# 合并同时到达的相同请求
+from config import ASK_COALESCE_TIMEOUT
+from request_coalescer import RequestCoalescer, CoalesceTimeout
+ask_coalescer = RequestCoalescer(ASK_COALESCE_TIMEOUT)
 
 # 处理文本和文件的端点
 @app.route('/ask', methods=['POST'])
@@ -66,17 +88,50 @@ def ask():
     # 获取JSON请求数据
     data = request.get_json()
     page_type = data.get('page_type', 'learning')  # 获取页面类型，默认为learning
+    error = unknown_collections_error(data.get('collections'))
+    if error:
+        return error
 
+    # 刷新本次请求所用上传文件的引用时间，避免被后台清理
+    for file in data.get('files', []):
+        upload_store.touch(file['url'].split('/')[-1], data.get('session_id') or get_session_id())
+
+    # 同时到达的相同请求只计算一次，共享结果
+    try:
+        response = ask_coalescer.run(RequestCoalescer.make_key(data), lambda: handle_ask(page_type, data))
+    except CoalesceTimeout:
+        return jsonify({'text': '相同问题正在处理中，等待超时，请稍后重试', 'files': []}), 504
+
+    # 返回响应
+    return jsonify(response)
+
+def handle_ask(page_type, data):
     # 根据页面类型选择处理器
     if page_type == 'learning':
-        response = learning_handler.handle_request(data)
+        return learning_handler.handle_request(data)
     elif page_type == 'usimage':
-        response = usimage_handler.handle_request(data)
-    else:
-        response = {'text': '无效的页面类型', 'files': []}
+        return usimage_handler.handle_request(data)
+    return {'text': '无效的页面类型', 'files': []}
 
-    # 返回响应
-    return jsonify(response)
+# 流式版本的 /ask：每行一个 JSON 事件，多图分析时每张图像完成后立即返回其结果
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    data = request.get_json()
+    page_type = data.get('page_type', 'learning')
+    handler = {'learning': learning_handler, 'usimage': usimage_handler}.get(page_type)
+    if handler is None:
+        return jsonify({'text': '无效的页面类型', 'files': []}), 400
+    error = unknown_collections_error(data.get('collections'))
+    if error:
+        return error
+
+    for file in data.get('files', []):
+        upload_store.touch(file['url'].split('/')[-1], data.get('session_id') or get_session_id())
+
+    def generate():
+        for event in handler.stream_request(data):
+            yield json.dumps(event, ensure_ascii=False) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 # 深度搜索端点（兼容旧代码，重定向到/ask）
 @app.route('/deepsearch', methods=['POST'])
@@ -89,6 +144,117 @@ def deepsearch():
     request.json = data  # 模拟请求数据
     return ask()
 
+# 流式语音合成：音频数据块到达后立即转发给浏览器，服务器不播放也不等待播放
+import time
+from config import TTS_SYNTHESIZER, TTS_MAX_CHARS
+from src.speech.speech_service import EdgeTTSSynthesizer, FakeSynthesizer, TTSMetrics, iter_audio
+synthesizer = FakeSynthesizer() if TTS_SYNTHESIZER == 'fake' else EdgeTTSSynthesizer()
+tts_metrics = TTSMetrics()
+
+def stream_tts(text, start):
+    if not text:
+        return jsonify({'error': '缺少 text 参数'}), 400
+    if len(text) > TTS_MAX_CHARS:
+        return jsonify({'error': f'文本过长，最多 {TTS_MAX_CHARS} 字'}), 413
+    # 不设置 Content-Length，按 chunked 方式边合成边发送
+    return Response(stream_with_context(iter_audio(synthesizer, text, tts_metrics, start)),
+                    mimetype=synthesizer.media_type, headers={'Cache-Control': 'no-store'})
+
+@app.route('/tts', methods=['GET', 'POST'])
+def tts():
+    # 短文本可直接放在查询参数中; 长文本请 POST 或使用 /ask 返回的 /tts/<id>
+    start = time.perf_counter()
+    if request.method == 'POST':
+        text = (request.get_json(silent=True) or {}).get('text') or request.form.get('text')
+    else:
+        text = request.args.get('text')
+    return stream_tts(text, start)
+
+@app.route('/tts/<text_id>')
+def tts_by_id(text_id):
+    start = time.perf_counter()
+    text = tts_texts.get(text_id)
+    if text is None:
+        return jsonify({'error': '语音文本不存在或已过期'}), 404
+    return stream_tts(text, start)
+
+# 多进程部署(见 gunicorn.conf.py)时在主进程中预加载模型和索引, 工作进程按写时复制共享
+if os.getenv('RAG_PRELOAD') == '1':
+    get_collection_manager().preload()
+
+# 后台索引构建任务
+ingest_queue = IngestJobQueue(get_collection_manager())
+
+def save_docx(file, folder):
+    # secure_filename 会去掉全部中文字符, 文件名加上内容哈希, 避免同名覆盖并保证 .docx 后缀
+    data = file.read()
+    stem = secure_filename(os.path.splitext(file.filename)[0])
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    filename = f'{stem}-{digest}.docx' if stem else f'{digest}.docx'
+    with open(os.path.join(folder, filename), 'wb') as f:
+        f.write(data)
+    return filename
+
+@app.route('/ingest', methods=['POST'])
+def ingest():
+    # 上传 DOCX 到集合目录并排队重建该集合的索引
+    collection = request.form.get('collection')
+    if not collection:
+        return jsonify({'error': '请指定集合名称'}), 400
+    files = request.files.getlist('files')
+    if not files or any(not f.filename.lower().endswith('.docx') for f in files):
+        return jsonify({'error': '请上传 DOCX 文件'}), 400
+    try:
+        collection_dir = ingest_queue.collection_dir(collection)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    os.makedirs(collection_dir, exist_ok=True)
+    for file in files:
+        save_docx(file, collection_dir)
+    job = ingest_queue.submit(collection)
+    return jsonify(job), 202
+
+@app.route('/ingest', methods=['GET'])
+def ingest_jobs():
+    return jsonify({'jobs': ingest_queue.list()})
+
+@app.route('/ingest/<job_id>', methods=['GET'])
+def ingest_status(job_id):
+    job = ingest_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job)
+
+# 运行状态端点
+@app.route('/status')
+def status():
+    return jsonify({
+        'uploads': upload_store.usage(),
+        'vision_cache': vision_cache.info(),
+        'rag_collections': get_collection_manager().info(),
+        'rag_memory': get_collection_manager().memory_status(),
+        'llm_scheduler': llm_scheduler.metrics(),
+        'ask_coalescer': ask_coalescer.metrics(),
+        'query_router': query_router.metrics() if query_router else None,
+        'tts': tts_metrics.metrics(),
+        'prompt_cache': prompt_cache.metrics() if prompt_cache else None,
+        'speculative_prefetch': prefetcher.metrics(),
+    })
+
+# 索引中的章节列表，供学习页面限定检索范围
+@app.route('/sections')
+def sections():
+    collection = request.args.get('collection', 'default')
+    error = unknown_collections_error([collection])
+    if error:
+        return error
+    return jsonify({'sections': get_rag_system(collection=collection).list_sections()})
+
+# 可检索的语料集合列表
+@app.route('/collections')
+def collections():
+    return jsonify({'collections': get_collection_manager().list_collections()})
+
 # 主页路由
 @app.route('/')
 def index():
@@ -0,0 +1,142 @@
+"""离线批量评测：用与 /ask 相同的流程（RAG、补全、工具调用）批量回答问题
+
+    python batch_eval.py questions.jsonl -o answers.jsonl --concurrency 8 --deep-search
+
+输入每行一个 JSON 对象：{"id": 可选, "question": 问题, "deep_search": 可选, "sections": 可选, "collections": 可选}
+输出每行一个结果，包含回答、各阶段耗时和 token 用量。输出文件同时作为断点：
+再次运行时会跳过已成功的问题，加 --no-resume 则重新开始。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from page_handlers import LearningHandler
+
+
+def load_questions(path):
+    questions = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault('id', str(line_no))
+            item['id'] = str(item['id'])
+            questions.append(item)
+    return questions
+
+
+def load_done_ids(path):
+    """读取已成功完成的问题ID"""
+    done = set()
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 上次中断时可能留下不完整的一行
+                if not result.get('error'):
+                    done.add(str(result['id']))
+    return done
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def run_one(handler, item, default_deep_search):
+    trace = {}
+    start = time.perf_counter()
+    result = {'id': item['id'], 'question': item['question']}
+    try:
+        response = handler.process_text(
+            item['question'],
+            item.get('deep_search', default_deep_search),
+            item.get('sections'),
+            item.get('collections'),
+            priority='batch',
+            trace=trace,
+        )
+        result['answer'] = response['text']
+        result['files'] = [f['original_name'] for f in response.get('files', [])]
+        result['error'] = None
+    except Exception as e:
+        result['answer'] = None
+        result['error'] = str(e)
+    result['latency_s'] = time.perf_counter() - start
+    result['timings'] = trace.get('timings', {})
+    result['usage'] = trace.get('usage', {})
+    result['tools'] = trace.get('tools', [])
+    return result
+
+
+def report(results, elapsed):
+    ok = [r for r in results if not r['error']]
+    latencies = [r['latency_s'] for r in ok]
+    print(f"\n完成 {len(results)} 个问题, 成功 {len(ok)}, 失败 {len(results) - len(ok)}, 用时 {elapsed:.1f}s")
+    if not ok:
+        return
+    print(f"吞吐量: {len(results) / elapsed:.2f} 问题/秒")
+    print(f"延迟: p50 {percentile(latencies, 50):.2f}s  p90 {percentile(latencies, 90):.2f}s  "
+          f"p99 {percentile(latencies, 99):.2f}s  max {max(latencies):.2f}s")
+    stages = sorted({stage for r in ok for stage in r['timings']})
+    for stage in stages:
+        values = [r['timings'][stage] for r in ok if stage in r['timings']]
+        print(f"  {stage:<13} 平均 {sum(values) / len(values):.2f}s  p90 {percentile(values, 90):.2f}s  ({len(values)} 次)")
+    prompt = sum(r['usage'].get('prompt_tokens', 0) for r in ok)
+    completion = sum(r['usage'].get('completion_tokens', 0) for r in ok)
+    print(f"token: 输入 {prompt}, 输出 {completion}, 平均每题 {(prompt + completion) / len(ok):.0f}")
+    cached = sum(r['usage'].get('cached_tokens', 0) for r in ok)
+    if cached:
+        print(f"上下文缓存: 命中 {cached} 个输入 token ({cached / prompt:.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量评测问答流程')
+    parser.add_argument('input', help='问题文件(JSONL)')
+    parser.add_argument('-o', '--output', default='answers.jsonl', help='结果文件(JSONL)，同时用于断点续跑')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时处理的问题数')
+    parser.add_argument('--deep-search', action='store_true', help='默认启用 RAG 检索')
+    parser.add_argument('--no-resume', action='store_true', help='忽略已有结果，重新开始')
+    args = parser.parse_args()
+
+    questions = load_questions(args.input)
+    if args.no_resume and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_done_ids(args.output)
+    pending = [q for q in questions if q['id'] not in done]
+    print(f"共 {len(questions)} 个问题, 已完成 {len(done)}, 待处理 {len(pending)}")
+
+    handler = LearningHandler(os.path.join(os.path.dirname(__file__), 'static/uploads'))
+    results = []
+    start = time.perf_counter()
+    with open(args.output, 'a', encoding='utf-8') as out, ThreadPoolExecutor(args.concurrency) as executor:
+        if out.tell() > 0:
+            out.write('\n')  # 上次中断可能留下没有换行的半行
+        futures = [executor.submit(run_one, handler, item, args.deep_search) for item in pending]
+        for i, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            # 每条结果立即落盘，作为断点
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            out.flush()
+            status = '失败: ' + result['error'] if result['error'] else f"{result['latency_s']:.1f}s"
+            print(f"[{i}/{len(pending)}] {result['id']} {status}")
+    report(results, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
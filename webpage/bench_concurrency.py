@@ -0,0 +1,95 @@
+"""并发压测：在不同并发数下请求 /ask，输出吞吐量和延迟曲线
+
+    # 用模拟大模型接口排除外部延迟，只测检索部分
+    python ../src/chat/mock_llm_server.py --latency 0
+    MOONSHOT_BASE_URL=http://127.0.0.1:8001/v1 gunicorn -c gunicorn.conf.py app:app
+    python bench_concurrency.py --url http://127.0.0.1:5000 --levels 1,2,4,8,16,32
+
+分别对 `python app.py` 与 gunicorn 多进程部署运行，比较相同并发下的 p50/p95 延迟。
+"""
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_QUESTIONS = [
+    "甲状腺结节的超声表现有哪些",
+    "彩色多普勒如何评估血流",
+    "肝脏弥漫性病变的声像图特点",
+    "乳腺肿块 BI-RADS 分级标准",
+    "低回声病灶的鉴别诊断",
+    "超声探头频率如何选择",
+]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def ask(url, question, deep_search):
+    body = json.dumps({'page_type': 'learning', 'text': question, 'deep_search': deep_search}).encode('utf-8')
+    req = urllib.request.Request(url + '/ask', data=body, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=300) as resp:
+            resp.read()
+        return time.perf_counter() - start, None
+    except Exception as e:
+        return time.perf_counter() - start, str(e)
+
+
+def run_level(url, questions, concurrency, requests, deep_search):
+    # 问题后加序号，避免相同请求被合并
+    items = [f"{questions[i % len(questions)]}（{concurrency}-{i}）" for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(lambda q: ask(url, q, deep_search), items))
+    elapsed = time.perf_counter() - start
+    latencies = [latency for latency, error in results if error is None]
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': sum(1 for _, error in results if error is not None),
+        'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/ask 并发压测')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--levels', default='1,2,4,8,16', help='逗号分隔的并发数')
+    parser.add_argument('--requests', type=int, default=0, help='每个并发数下的请求数，默认为并发数的 8 倍')
+    parser.add_argument('--questions', help='问题文件，每行一个问题')
+    parser.add_argument('--no-deep-search', action='store_true', help='不启用 RAG 检索')
+    parser.add_argument('-o', '--output', help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, 'r', encoding='utf-8') as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    # 预热，避免把首次加载计入第一档
+    ask(args.url, questions[0], not args.no_deep_search)
+
+    rows = []
+    print(f"{'并发':>6} {'请求':>6} {'失败':>6} {'吞吐(个/s)':>12} {'p50(s)':>8} {'p95(s)':>8} {'p99(s)':>8}")
+    for level in [int(x) for x in args.levels.split(',')]:
+        row = run_level(args.url, questions, level, args.requests or level * 8, not args.no_deep_search)
+        rows.append(row)
+        print(f"{row['concurrency']:>6} {row['requests']:>6} {row['errors']:>6} {row['throughput']:>12.2f} "
+              f"{row['p50']:>8.3f} {row['p95']:>8.3f} {row['p99']:>8.3f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,54 @@ import os
 # API配置
 API_KEY = os.getenv("API_KEY")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-MOONSHOT_BASE_URL = "https://api.moonshot.cn/v1"
+MOONSHOT_BASE_URL = os.getenv("MOONSHOT_BASE_URL", "https://api.moonshot.cn/v1")  # 可指向本地模拟服务器
 DEEPSEEK_API_URL = "https://api.deepseek.com/v1/medical/ultrasound"
 
 # 语音配置
-VOICE_NAME = "zh-CN-XiaoxiaoNeural"
\ No newline at end of file
+VOICE_NAME = "zh-CN-XiaoxiaoNeural"
+TTS_SYNTHESIZER = os.getenv("TTS_SYNTHESIZER", "edge")  # edge: EdgeTTS; fake: 本地模拟, 用于测试
+TTS_MAX_CHARS = int(os.getenv("TTS_MAX_CHARS", 3000))  # 单次合成的最大字数
+TTS_TEXT_DIR = os.getenv("TTS_TEXT_DIR", os.path.join(os.path.dirname(__file__), "cache", "tts"))  # 待朗读文本, 以短 id 供 /tts/<id> 读取
+TTS_TEXT_TTL_SECONDS = int(os.getenv("TTS_TEXT_TTL_SECONDS", 3600))
+
+# 大模型调用调度配置
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 4))  # 同时进行的请求数
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 60))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 120000))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))  # 429 时的最大重试次数
+
+# 上下文缓存配置: 复用系统提示、历史对话等不变的请求前缀
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "1") == "1"
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", 3600))  # 缓存有效期(秒)
+# 前缀达到该 token 数才创建缓存; 网页问答的前缀(系统提示和工具定义)约 700 token, 默认不缓存, 只有较长的对话历史会缓存
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", 1024))
+PROMPT_CACHE_MIN_USES = int(os.getenv("PROMPT_CACHE_MIN_USES", 2))  # 同一前缀出现该次数后才创建缓存
+LLM_INPUT_PRICE_PER_M = float(os.getenv("LLM_INPUT_PRICE_PER_M", 12.0))  # 每百万输入 token 价格(元), 用于估算节省
+LLM_CACHED_INPUT_PRICE_PER_M = float(os.getenv("LLM_CACHED_INPUT_PRICE_PER_M", 1.2))  # 命中缓存的输入 token 价格
+
+# 上传文件配置
+UPLOAD_QUOTA_BYTES = int(os.getenv("UPLOAD_QUOTA_BYTES", 512 * 1024 * 1024))  # 上传目录容量配额
+UPLOAD_TTL_SECONDS = int(os.getenv("UPLOAD_TTL_SECONDS", 7 * 24 * 3600))  # 会话引用有效期
+UPLOAD_GC_INTERVAL = int(os.getenv("UPLOAD_GC_INTERVAL", 600))  # 后台清理间隔(秒)
+UPLOAD_INDEX_PATH = os.getenv("UPLOAD_INDEX_PATH", os.path.join(os.path.dirname(__file__), "cache", "upload_refs.json"))  # 引用索引, 不可放在 static 下
+
+# 图像分析缓存配置
+VISION_CACHE_PATH = os.getenv("VISION_CACHE_PATH", os.path.join(os.path.dirname(__file__), "cache", "vision_cache.sqlite3"))
+VISION_CACHE_MAX_ENTRIES = int(os.getenv("VISION_CACHE_MAX_ENTRIES", 2000))
+VISION_CACHE_TTL_SECONDS = int(os.getenv("VISION_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+
+# 多图分析配置
+VISION_MAX_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", 4))  # 单个请求中同时分析的图像数
+VISION_MULTI_IMAGE_MODE = os.getenv("VISION_MULTI_IMAGE_MODE", "per_image")  # per_image: 逐张并发请求; combined: 一次请求发送全部图像
+
+# 相同请求合并配置
+ASK_COALESCE_TIMEOUT = int(os.getenv("ASK_COALESCE_TIMEOUT", 120))  # 等待相同请求结果的最长秒数
+
+# 推测预取配置: 请求到达时即并行调用 DeepSeek 知识库, 模型请求该工具时直接使用结果
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "0") == "1"
+PREFETCH_MAX_WORKERS = int(os.getenv("PREFETCH_MAX_WORKERS", 4))  # 同时进行的预取数
+
+# 查询路由配置
+QUERY_ROUTER_ENABLED = os.getenv("QUERY_ROUTER_ENABLED", "1") == "1"  # 关闭后所有问题都走检索并提供全部工具
+QUERY_ROUTER_LOG_PATH = os.getenv("QUERY_ROUTER_LOG_PATH", os.path.join(os.path.dirname(__file__), "cache", "query_router.jsonl"))
+QUERY_ROUTER_SKIP_GREETING_RAG = os.getenv("QUERY_ROUTER_SKIP_GREETING_RAG", "1") == "1"  # 问候语即使开启深度搜索也不检索
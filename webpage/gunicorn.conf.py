@@ -0,0 +1,55 @@
+"""多进程部署配置
+
+    cd webpage && gunicorn -c gunicorn.conf.py app:app
+
+主进程导入 app 时加载嵌入模型和默认集合的索引(只读内存映射), 随后 fork 出工作进程,
+模型权重和索引页在进程间写时复制共享。各组件在 fork 后由 os.register_at_fork 重建锁和后台线程,
+CPU 核心按工作进程数平分给 torch 和 FAISS。
+
+进程内状态在多进程下的处理:
+    LLM_MAX_CONCURRENCY / LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE 是整个部署的额度,
+        每个工作进程的调度器只使用 1/workers(至少为 1)
+    上传引用索引由文件锁保护, 各进程共用; 上传 GC 只在主进程中运行
+    索引任务在接收请求的进程中执行, 状态写入文件供所有进程查询, 其他进程下次查询时重新加载新索引
+    图像分析缓存使用 SQLite, 各进程共用; 相同请求合并、查询路由和预取统计等仍按进程计算
+"""
+import gc
+import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径; webpage 目录在前, 使 config 指向网页配置
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from src.RAG.thread_tuning import configure_threads, set_thread_env, threads_per_worker
+
+bind = os.getenv("WEB_BIND", "127.0.0.1:5000")
+workers = int(os.getenv("WEB_WORKERS", 4))
+# 每个进程内的请求线程; 查询编码经批处理器合并, 不会按线程数放大计算线程
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", 4))
+timeout = 180
+preload_app = True
+
+compute_threads = int(os.getenv("WEB_COMPUTE_THREADS", 0)) or threads_per_worker(workers)
+
+# 必须在主进程导入 torch/faiss 之前设置
+set_thread_env(compute_threads)
+os.environ.setdefault("RAG_PRELOAD", "1")
+os.environ.setdefault("RAG_MMAP_INDEX", "1")
+
+# 大模型调用额度按工作进程数平分; 预加载时 app 在此之后才导入 config 的这些值
+import config
+for name in ("LLM_MAX_CONCURRENCY", "LLM_REQUESTS_PER_MINUTE", "LLM_TOKENS_PER_MINUTE"):
+    setattr(config, name, max(1, getattr(config, name) // workers))
+
+
+def pre_fork(server, worker):
+    # 把预加载的对象移出 GC 跟踪, 避免子进程中的垃圾回收改写这些页而触发复制
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    configure_threads(compute_threads)
+    server.log.info(f"工作进程 {worker.pid}: 计算线程数 {compute_threads}")
@@ -2,33 +2,74 @@ from flask import jsonify, url_for
 from werkzeug.utils import secure_filename
 import os
 import json
-from uuid import uuid4
-from typing import Optional, Tuple, List, Dict, Any
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Tuple, List, Dict, Any, Iterator
 
-from src.chat.chat_service import client, tools, tool_map as chat_tool_map
-from src.image.image_service import encode_image_to_base64
-from src.RAG.rag_system import call_rag_query, copy_images_to_static
+from src.chat.chat_service import chat_completion, tools, tool_map as chat_tool_map
+from src.chat.query_router import QueryRouter
+from src.image.image_service import encode_bytes_to_base64
+from src.image.vision_cache import VisionCache, hash_image_bytes
+from src.RAG.rag_system import call_rag_context, copy_images_to_static, get_collection_manager
+from src.RAG.context_assembler import format_context
+from config import (UPLOAD_QUOTA_BYTES, UPLOAD_TTL_SECONDS, UPLOAD_INDEX_PATH, VISION_CACHE_PATH,
+                    VISION_CACHE_MAX_ENTRIES, VISION_CACHE_TTL_SECONDS, QUERY_ROUTER_ENABLED, QUERY_ROUTER_LOG_PATH,
+                    QUERY_ROUTER_SKIP_GREETING_RAG,
+                    VISION_MAX_CONCURRENCY, VISION_MULTI_IMAGE_MODE, SPECULATIVE_PREFETCH, PREFETCH_MAX_WORKERS,
+                    TTS_MAX_CHARS, TTS_TEXT_DIR, TTS_TEXT_TTL_SECONDS)
+from upload_store import UploadStore
+from tts_text_store import TTSTextStore
+from speculative_prefetch import SpeculativePrefetcher
+
+VISION_MODEL = "moonshot-v1-128k-vision-preview"
+VISION_TEMPERATURE = 0.3
+DEFAULT_IMAGE_PROMPT = "请分析这张超声图像，识别病灶区域和正常区域的特征。"
+
+# 图像分析结果缓存，各页面处理器共用
+vision_cache = VisionCache(VISION_CACHE_PATH, VISION_CACHE_MAX_ENTRIES, VISION_CACHE_TTL_SECONDS)
+# 查询路由复用 RAG 的嵌入模型, 在第一次无法按关键词判断时才加载
+query_router = QueryRouter(
+    lambda text: get_collection_manager().embedder.embed_query(text),
+    lambda texts: get_collection_manager().embedder.embed_documents(texts),
+    QUERY_ROUTER_LOG_PATH,
+    skip_greeting_retrieval=QUERY_ROUTER_SKIP_GREETING_RAG,
+) if QUERY_ROUTER_ENABLED else None
+# 推测预取 DeepSeek 知识库结果, 各页面处理器共用
+PREFETCH_TOOL = "query_ultrasound_knowledge"
+prefetcher = SpeculativePrefetcher(chat_tool_map[PREFETCH_TOOL], PREFETCH_MAX_WORKERS)
+# 待朗读文本保存在服务器上, 音频地址只携带短 id
+tts_texts = TTSTextStore(TTS_TEXT_DIR, TTS_TEXT_TTL_SECONDS)
 # from src.RAG.image_utils import copy_images_to_static
 
+def text_to_speech_url(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """网页中的语音工具: 不在服务器上合成和播放, 返回浏览器可直接播放的 /tts 流式音频地址"""
+    text = arguments.get("text")
+    if not text:
+        return {"error": "参数缺少'text'字段"}
+    if len(text) > TTS_MAX_CHARS:
+        return {"error": f"文本过长，最多 {TTS_MAX_CHARS} 字"}
+    return {"status": "success", "audio_url": f"/tts/{tts_texts.put(text)}"}
+
 class PageHandler:
-    def __init__(self, upload_folder: str):
+    def __init__(self, upload_folder: str, upload_store=None):
         self.upload_folder = upload_folder
+        self.upload_store = upload_store or UploadStore(upload_folder, UPLOAD_QUOTA_BYTES, UPLOAD_TTL_SECONDS,
+                                                          UPLOAD_INDEX_PATH)
         self.tool_map = chat_tool_map.copy()
+        self.tool_map["text_to_speech"] = text_to_speech_url
         self.system_message = {
             "role": "system",
             "content": "你是一个医学超声领域的AI助手，擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。你具备医学超声图像分析能力，可以分析已分割好病灶和正常区域的超声图像。"
         }
 
-    def handle_file_upload(self, files) -> Tuple[List[Dict[str, str]], Optional[str]]:
+    def handle_file_upload(self, files, session_id: str = 'anonymous') -> Tuple[List[Dict[str, str]], Optional[str]]:
         """处理文件上传"""
         uploaded_files = []
         for file in files:
             if file and file.filename:
                 original_filename = secure_filename(file.filename)
-                extension = os.path.splitext(original_filename)[1]
-                new_filename = str(uuid4()) + extension
-                file_path = os.path.join(self.upload_folder, new_filename)
-                file.save(file_path)
+                # 与 /upload 共用内容哈希存储，同一文件不会重复保存
+                new_filename = self.upload_store.save(file, session_id)
                 file_url = url_for('static', filename=f'uploads/{new_filename}')
                 uploaded_files.append({
                     'original_name': original_filename,
@@ -38,62 +79,214 @@ class PageHandler:
                 return [], "无效文件"
         return uploaded_files, None
 
-    def process_image(self, image_url: str, text: str) -> str:
-        """处理图像分析"""
+    def analyze_image_file(self, image_path: str, text: str) -> str:
+        """分析本地图像文件，相同图像和问题直接返回缓存结果"""
+        image = self._load_image(image_path)
+        prompt = text if text else DEFAULT_IMAGE_PROMPT
+        key = vision_cache.make_key(image['hash'], prompt, VISION_MODEL, VISION_TEMPERATURE)
+        return vision_cache.get_or_compute(key, lambda: self._call_vision([self._encode_image(image)], prompt))
+
+    @staticmethod
+    def _load_image(image_path: str) -> Dict[str, Any]:
+        """读取图像并计算内容哈希，base64 编码留到缓存未命中时再做"""
+        with open(image_path, "rb") as f:
+            image_data = f.read()
+        return {'hash': hash_image_bytes(image_data), 'data': image_data, 'ext': os.path.splitext(image_path)[1][1:]}
+
+    @staticmethod
+    def _encode_image(image: Dict[str, Any]) -> str:
+        return encode_bytes_to_base64(image['data'], image['ext'])
+
+    def analyze_images(self, files: List[Dict[str, str]], text: str, mode: Optional[str] = None,
+                       max_workers: int = VISION_MAX_CONCURRENCY) -> Iterator[Dict[str, Any]]:
+        """分析多张图像，按完成顺序逐个产出结果
+
+        mode 为 per_image 时每张图像单独请求，最多 max_workers 个同时进行；
+        为 combined 时所有图像在一次请求中发送，产出一个覆盖全部图像的结果。
+        每个结果包含 indexes(对应 files 的下标)、text、latency_s 和 error。
+        """
+        mode = mode or VISION_MULTI_IMAGE_MODE
+        if mode == 'combined' and len(files) > 1:
+            yield self._analyze_combined(files, text, max_workers)
+            return
+
+        def analyze(index, file):
+            start = time.perf_counter()
+            result = {'indexes': [index], 'error': None}
+            try:
+                result['text'] = self.analyze_image_file(
+                    os.path.join(self.upload_folder, file['url'].split('/')[-1]), text)
+            except Exception as e:
+                result['text'] = f"图像分析失败: {str(e)}"
+                result['error'] = str(e)
+            result['latency_s'] = time.perf_counter() - start
+            return result
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files)))) as executor:
+            futures = [executor.submit(analyze, i, file) for i, file in enumerate(files)]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _analyze_combined(self, files: List[Dict[str, str]], text: str, max_workers: int) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = {'indexes': list(range(len(files))), 'error': None}
         try:
-            filename = image_url.split('/')[-1]
-            image_path = os.path.join(self.upload_folder, filename)
-            image_base64 = encode_image_to_base64(image_path)
-            
-            messages = [self.system_message]
-            prompt = text if text else "请分析这张超声图像，识别病灶区域和正常区域的特征。"
-            messages.append({
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": image_base64}
-                    },
-                    {"type": "text", "text": prompt}
-                ]
-            })
-            
-            completion = client.chat.completions.create(
-                model="moonshot-v1-128k-vision-preview",
-                messages=messages,
-                temperature=0.3
-            )
-            return completion.choices[0].message.content
+            # 并行读取并计算哈希，缓存未命中时再编码，一次请求发送全部图像
+            paths = [os.path.join(self.upload_folder, file['url'].split('/')[-1]) for file in files]
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files)))) as executor:
+                images = list(executor.map(self._load_image, paths))
+            prompt = text if text else DEFAULT_IMAGE_PROMPT
+            key = vision_cache.make_key(
+                ",".join(image['hash'] for image in images), prompt, VISION_MODEL, VISION_TEMPERATURE)
+            result['text'] = vision_cache.get_or_compute(
+                key, lambda: self._call_vision([self._encode_image(image) for image in images], prompt))
         except Exception as e:
-            return f"图像分析失败: {str(e)}"
+            result['text'] = f"图像分析失败: {str(e)}"
+            result['error'] = str(e)
+        result['latency_s'] = time.perf_counter() - start
+        return result
+
+    @staticmethod
+    def format_image_results(files: List[Dict[str, str]], results: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """把多图分析结果合并为回复文本，并给出每张图像的耗时"""
+        results = sorted(results, key=lambda r: r['indexes'][0])
+        if len(results) == 1:
+            response_text = results[0]['text']
+        else:
+            response_text = "\n\n".join(
+                f"图像 {r['indexes'][0] + 1}（{files[r['indexes'][0]]['original_name']}）：\n{r['text']}" for r in results
+            )
+        images = [
+            {'original_name': files[i]['original_name'], 'latency_s': r['latency_s'], 'error': r['error']}
+            for r in results for i in r['indexes']
+        ]
+        return response_text, images
+
+    def stream_request(self, data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """与 handle_request 相同，但每张图像分析完成后立即产出一条 image 事件，最后产出 done 事件"""
+        files = data.get('files', [])
+        if not files:
+            yield {'type': 'done', **self.handle_request(data)}
+            return
+        results = []
+        for result in self.analyze_images(files, data.get('text', ''), data.get('image_mode')):
+            results.append(result)
+            yield {
+                'type': 'image',
+                'files': [files[i] for i in result['indexes']],
+                'text': result['text'],
+                'latency_s': result['latency_s'],
+                'error': result['error'],
+            }
+        yield {'type': 'done', **self._image_response(files, results)}
+
+    def _image_response(self, files: List[Dict[str, str]], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        response_text, images = self.format_image_results(files, results)
+        return {'text': response_text, 'files': files, 'images': images}
+
+    def _call_vision(self, images_base64: List[str], prompt: str) -> str:
+        messages = [self.system_message]
+        messages.append({
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {"url": image_base64}
+                }
+                for image_base64 in images_base64
+            ] + [{"type": "text", "text": prompt}]
+        })
+
+        completion = chat_completion(
+            model=VISION_MODEL,
+            messages=messages,
+            temperature=VISION_TEMPERATURE
+        )
+        return completion.choices[0].message.content
+
+    def process_text(self, text: str, deep_search: bool = False, sections: Optional[List[str]] = None,
+                     collections: Optional[List[str]] = None, priority: str = "interactive",
+                     trace: Optional[Dict[str, Any]] = None, speculative: Optional[bool] = None) -> str:
+        """处理文本查询, sections 将检索限定在指定章节内, collections 指定检索的语料集合
+
+        speculative 为 True 时在检索的同时预取 DeepSeek 知识库结果, 默认按 SPECULATIVE_PREFETCH 配置
+
+        传入 trace 字典时, 会在其中记录各阶段耗时(timings)、token 用量(usage)、调用的工具(tools)和路由结果(route)
+        """
+        request_start = time.perf_counter()
+        trace = trace if trace is not None else {}
+        timings = trace.setdefault("timings", {})
+        usage = trace.setdefault("usage", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+                                           "cached_tokens": 0})
+        trace.setdefault("tools", [])
+        # 只有系统提示和工具定义每次都相同, 作为请求前缀交给上下文缓存; 检索上下文随问题变化, 不放入前缀
+        # 该前缀约 700 token, 低于默认的 PROMPT_CACHE_MIN_TOKENS, 默认配置下不会创建缓存
+        messages = [self.system_message]
+        picture_paths = []
 
-    def process_text(self, text: str, deep_search: bool = False) -> str:
-        """处理文本查询"""
-        messages = [self.system_message, {"role": "user", "content": text}]
+        # 问候、闲聊等问题只提供需要的工具, 避免多一轮工具调用; 深度搜索只对按关键词识别的问候语跳过
+        offered_tools = tools
+        decision = None
+        if query_router is not None:
+            start = time.perf_counter()
+            # 未开启深度搜索时嵌入模型可能尚未加载, 只按关键词规则路由
+            decision = query_router.route(text, use_embeddings=deep_search)
+            timings["routing"] = time.perf_counter() - start
+            trace["route"] = decision
+            offered_tools = [tool for tool in tools if tool["function"]["name"] in decision["tools"]]
+
+        # 模型可能请求知识库工具时提前开始调用, 与检索和第一次补全并行
+        speculative = SPECULATIVE_PREFETCH if speculative is None else speculative
+        speculative = speculative and any(tool["function"]["name"] == PREFETCH_TOOL for tool in offered_tools)
+        prefetch = prefetcher.start(text) if speculative else None
         
-        if deep_search:
-            rag_result, picture_paths = call_rag_query(text)
-            if rag_result:
-                messages.append({"role": "system", "content": f"相关知识：\n{rag_result}"})
+        if deep_search and decision is not None and not decision["retrieval"]:
+            query_router.record_skipped_retrieval()
+        elif deep_search:
+            # 结构化上下文已合并相邻段落、去重并按 token 预算截取
+            start = time.perf_counter()
+            context = call_rag_context(text, sections=sections, collections=collections)
+            timings["rag"] = time.perf_counter() - start
+            if context and context["segments"]:
+                messages.append({"role": "system", "content": f"相关知识：\n{format_context(context)}"})
+                picture_paths = context["images"]
+        cache_prefix = 1
+        messages.append({"role": "user", "content": text})
         
-        completion = client.chat.completions.create(
+        start = time.perf_counter()
+        params = {"tools": offered_tools} if offered_tools else {}
+        completion = chat_completion(
+            priority=priority,
+            cache_prefix=cache_prefix,
             model="moonshot-v1-128k",
             messages=messages,
             temperature=0.3,
-            tools=tools
+            **params
         )
+        timings["completion"] = time.perf_counter() - start
+        self._add_usage(usage, completion)
         
         choice = completion.choices[0]
         if choice.finish_reason == "tool_calls" and hasattr(choice.message, 'tool_calls'):
             messages.append(choice.message)
             
+            start = time.perf_counter()
             for tool_call in choice.message.tool_calls:
                 tool_name = tool_call.function.name
                 if tool_name not in self.tool_map:
                     continue
                 
                 tool_args = json.loads(tool_call.function.arguments)
-                tool_result = self.tool_map[tool_name](tool_args)
+                tool_result = None
+                if tool_name == PREFETCH_TOOL and prefetch is not None:
+                    tool_result = prefetcher.take(prefetch, tool_args)
+                    trace["prefetch"] = "hit" if tool_result is not None else "miss"
+                    prefetch = None
+                if tool_result is None:
+                    tool_result = self.tool_map[tool_name](tool_args)
+                trace["tools"].append(tool_name)
+                if isinstance(tool_result, dict) and tool_result.get("audio_url"):
+                    trace["audio_url"] = tool_result["audio_url"]
                 
                 messages.append({
                     "role": "tool",
@@ -102,37 +295,68 @@ class PageHandler:
                     "content": json.dumps(tool_result)
                 })
             
-            completion = client.chat.completions.create(
+            timings["tools"] = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            completion = chat_completion(
+                priority=priority,
+                cache_prefix=cache_prefix,
                 model="moonshot-v1-128k",
                 messages=messages,
                 temperature=0.3
             )
+            timings["completion_2"] = time.perf_counter() - start
+            self._add_usage(usage, completion)
         
         response = completion.choices[0].message.content
+        if prefetch is not None:
+            prefetcher.discard(prefetch)
+            trace["prefetch"] = "unused"
+        prefetcher.record_request(speculative, time.perf_counter() - request_start)
+        if decision is not None:
+            query_router.log(text, decision, trace)
+        result = {'text': response, 'files': []}
+        if "audio_url" in trace:
+            # 语音由浏览器从 /tts 流式获取并播放
+            result['audio_url'] = trace["audio_url"]
         if deep_search and picture_paths:
             # 复制相关图片到static目录并获取URL
+            start = time.perf_counter()
             image_urls = copy_images_to_static(picture_paths, os.path.dirname(self.upload_folder))
+            timings["images"] = time.perf_counter() - start
             if image_urls:
                 response += "\n\n相关图片："
                 for image_info in image_urls:
                     response += f"\n- {image_info['original_name']}"
-                return {'text': response, 'files': image_urls}
-        return {'text': response, 'files': []}
+                result.update(text=response, files=image_urls)
+        return result
+
+    @staticmethod
+    def _add_usage(usage: Dict[str, int], completion):
+        # 累计一次补全请求的 token 用量
+        completion_usage = getattr(completion, "usage", None)
+        for key in usage:
+            usage[key] += getattr(completion_usage, key, 0) or 0
 
 class LearningHandler(PageHandler):
+    def _image_response(self, files: List[Dict[str, str]], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        response = super()._image_response(files, results)
+        response['text'] += "\n文件:\n" + "\n".join([f"- {file['original_name']}" for file in files])
+        return response
+
     def handle_request(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """处理learning页面的请求"""
         text = data.get('text', '')
         files = data.get('files', [])
         deep_search = data.get('deep_search', False)
+        sections = data.get('sections')  # 学习页面可限定检索的章节
+        collections = data.get('collections')  # 检索的语料集合, 默认只用原教材
         
         if files and len(files) > 0:
-            response_text = self.process_image(files[0]['url'], text)
-            if files:
-                response_text += "\n文件:\n" + "\n".join([f"- {file['original_name']}" for file in files])
-            return {'text': response_text, 'files': files}
+            return self._image_response(files, list(self.analyze_images(files, text, data.get('image_mode'))))
         else:
-            response = self.process_text(text, deep_search)
+            response = self.process_text(text, deep_search, sections, collections,
+                                         speculative=data.get('speculative'))
             if isinstance(response, dict):
                 return response
             return {'text': response, 'files': []}
@@ -144,9 +368,10 @@ class UsimageHandler(PageHandler):
         files = data.get('files', [])
         
         if files and len(files) > 0:
-            response_text = self.process_image(files[0]['url'], text)
+            return self._image_response(files, list(self.analyze_images(files, text, data.get('image_mode'))))
         elif text:
-            response_text = self.process_text(text)
+            # process_text 返回完整的回复(含相关图片和语音地址)
+            return self.process_text(text)
         else:
             response_text = "请提供超声图像或相关问题"
         
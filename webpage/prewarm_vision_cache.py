@@ -0,0 +1,40 @@
+"""为教学常用的示例超声图像预热图像分析缓存
+
+    python prewarm_vision_cache.py 图像目录 [--prompt 问题 ...]
+"""
+import argparse
+import glob
+import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from page_handlers import LearningHandler, vision_cache, DEFAULT_IMAGE_PROMPT
+from src.image.vision_cache import prewarm
+
+IMAGE_PATTERNS = ('*.png', '*.jpg', '*.jpeg')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='预热图像分析缓存')
+    parser.add_argument('image_dir', help='精选图像所在目录')
+    parser.add_argument('--prompt', action='append', help='需要预热的问题，可重复；默认使用页面的默认问题')
+    args = parser.parse_args()
+
+    image_paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(args.image_dir, pattern)))
+    if not image_paths:
+        print('目录下没有图像文件')
+        return
+    prompts = args.prompt or [DEFAULT_IMAGE_PROMPT]
+
+    handler = LearningHandler(os.path.join(os.path.dirname(__file__), 'static/uploads'))
+    result = prewarm(vision_cache, image_paths, prompts, handler.analyze_image_file)
+    print(f"图像 {len(image_paths)} 张, 问题 {len(prompts)} 个: "
+          f"已缓存 {result['cached']}, 新生成 {result['generated']}, 失败 {result['failed']}")
+    print(f"缓存条目数: {vision_cache.info()['entries']}")
+
+
+if __name__ == '__main__':
+    main()
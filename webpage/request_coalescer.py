@@ -0,0 +1,89 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict
+
+from src.image.vision_cache import normalize_prompt
+
+
+class CoalesceTimeout(Exception):
+    """等待相同请求的结果超时"""
+
+
+class RequestCoalescer:
+    """合并同时到达的相同 /ask 请求
+
+    第一个请求（leader）执行实际计算，其余相同请求等待并共享其结果或异常。
+    等待超过 timeout 秒的请求抛出 CoalesceTimeout，leader 的计算不受影响。
+    """
+
+    def __init__(self, timeout: float = 120):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self.stats = {'requests': 0, 'leaders': 0, 'coalesced': 0, 'timeouts': 0, 'errors': 0}
+        if hasattr(os, 'register_at_fork'):  # Windows 不支持 fork
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    @staticmethod
+    def make_key(data: Dict[str, Any]) -> str:
+        """按规范化后的 (页面类型, 文本, 深度搜索, 文件哈希, 检索范围, 多图模式) 生成键"""
+        # 上传文件按内容哈希命名，文件名即可代表文件内容
+        files = sorted(f.get('url', '').split('/')[-1] for f in data.get('files', []))
+        raw = json.dumps([
+            data.get('page_type', 'learning'),
+            normalize_prompt(data.get('text', '')),
+            bool(data.get('deep_search', False)),
+            files,
+            sorted(data.get('sections') or []),
+            sorted(data.get('collections') or []),
+            data.get('image_mode'),
+        ], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def run(self, key: str, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.stats['requests'] += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.stats['leaders'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            try:
+                # 返回副本，避免多个请求共享同一个可变对象
+                return copy.deepcopy(future.result(timeout=self.timeout))
+            except FutureTimeout:
+                if future.done():
+                    raise  # leader 自身抛出的超时异常, 原样传递
+                with self._lock:
+                    self.stats['timeouts'] += 1
+                raise CoalesceTimeout(f'等待相同请求超过 {self.timeout} 秒') from None
+
+        try:
+            result = compute()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            with self._lock:
+                self.stats['errors'] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._inflight))
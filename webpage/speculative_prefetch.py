@@ -0,0 +1,105 @@
+import difflib
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from src.image.vision_cache import normalize_prompt
+
+
+class SpeculativePrefetcher:
+    """在模型请求工具之前预先调用 DeepSeek 知识库
+
+    请求到达时在后台调用工具，与 RAG 检索和第一次补全并行进行。模型请求该工具且问题与用户问题足够相似时
+    直接使用预取结果（必要时等待其完成）；模型没有请求工具时丢弃结果。
+
+    Args:
+        tool_fn: 工具函数，参数为 {"question": 问题}
+        max_workers: 同时进行的预取数
+        min_similarity: 模型传入的问题与用户问题的相似度达到该值才复用预取结果
+    """
+
+    def __init__(self, tool_fn: Callable[[Dict[str, Any]], Any], max_workers: int = 4, min_similarity: float = 0.3):
+        self.tool_fn = tool_fn
+        self.max_workers = max_workers
+        self.min_similarity = min_similarity
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tool-prefetch')
+        self._lock = threading.Lock()
+        self.stats = {
+            'speculations': 0, 'hits': 0, 'unused': 0, 'mismatches': 0, 'failures': 0,
+            'saved_s': 0.0, 'wasted_tool_s': 0.0,
+            'speculative_requests': 0, 'speculative_latency_s': 0.0,
+            'plain_requests': 0, 'plain_latency_s': 0.0,
+        }
+        if hasattr(os, 'register_at_fork'):  # Windows 不支持 fork
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tool-prefetch')
+
+    def _record(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self.stats[key] += value
+
+    def start(self, question: str) -> Future:
+        """开始预取，返回的 Future 结果为 (工具结果, 耗时秒数)"""
+        def run():
+            start = time.perf_counter()
+            return self.tool_fn({'question': question}), time.perf_counter() - start
+
+        self._record(speculations=1)
+        future = self._executor.submit(run)
+        future.question = question
+        return future
+
+    def take(self, future: Future, arguments: Dict[str, Any]) -> Optional[Any]:
+        """模型请求工具时调用；问题相似则返回预取结果，否则返回 None 由调用方重新调用工具"""
+        requested = normalize_prompt(arguments.get('question', ''))
+        similarity = difflib.SequenceMatcher(None, normalize_prompt(future.question), requested).ratio()
+        if similarity < self.min_similarity:
+            self.discard(future, mismatch=True)
+            return None
+        wait_start = time.perf_counter()
+        try:
+            result, duration = future.result()
+        except Exception:
+            self._record(failures=1)
+            return None
+        waited = time.perf_counter() - wait_start
+        # 与检索和第一次补全重叠的部分即为节省的时间
+        self._record(hits=1, saved_s=max(0.0, duration - waited))
+        return result
+
+    def discard(self, future: Future, mismatch: bool = False):
+        """不再需要预取结果，尚未开始时取消"""
+        self._record(**({'mismatches': 1} if mismatch else {'unused': 1}))
+        if future.cancel():
+            return
+
+        def count_waste(done):
+            if not done.cancelled() and done.exception() is None:
+                self._record(wasted_tool_s=done.result()[1])
+        future.add_done_callback(count_waste)
+
+    def record_request(self, speculative: bool, seconds: float):
+        """记录整个请求的耗时，用于对比开启预取前后的端到端延迟"""
+        if speculative:
+            self._record(speculative_requests=1, speculative_latency_s=seconds)
+        else:
+            self._record(plain_requests=1, plain_latency_s=seconds)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        decided = stats['hits'] + stats['unused'] + stats['mismatches']
+        return dict(
+            stats,
+            hit_rate=stats['hits'] / decided if decided else 0.0,
+            saved_avg_s=stats['saved_s'] / stats['hits'] if stats['hits'] else 0.0,
+            speculative_latency_avg_s=(stats['speculative_latency_s'] / stats['speculative_requests']
+                                       if stats['speculative_requests'] else 0.0),
+            plain_latency_avg_s=stats['plain_latency_s'] / stats['plain_requests'] if stats['plain_requests'] else 0.0,
+        )
@@ -82,6 +82,68 @@ async function uploadFiles(files) {
     }
 }
 
+// 创建语音播放器：音频由/tts边合成边流式返回，浏览器收到数据后即开始播放
+function createAudioPlayer(audioUrl) {
+    const audio = document.createElement('audio');
+    audio.src = audioUrl;
+    audio.controls = true; // 浏览器阻止自动播放时可手动播放
+    audio.autoplay = true;
+    audio.style.display = 'block';
+    audio.style.marginTop = '5px';
+    return audio;
+}
+
+// 在回复消息中渲染文本、文件和语音
+function renderResponse(responseDiv, result) {
+    responseDiv.innerHTML = marked.parse(result.text); // 渲染Markdown
+    if (result.files && result.files.length > 0) {
+        const fileDisplayContainer = document.createElement('div');
+        fileDisplayContainer.className = 'file-preview-container';
+        fileDisplayContainer.style.marginTop = '5px';
+        result.files.forEach(fileInfo => {
+            const fileDisplay = createFileDisplay(fileInfo, true); // 后端响应中图片直接展示
+            fileDisplayContainer.appendChild(fileDisplay);
+        });
+        responseDiv.appendChild(fileDisplayContainer);
+    }
+    if (result.audio_url) {
+        responseDiv.appendChild(createAudioPlayer(result.audio_url));
+    }
+}
+
+// 异步函数：请求/ask/stream，每收到一行JSON事件调用一次onEvent，返回最后的done事件
+async function askStream(body, onEvent) {
+    const response = await fetch('/ask/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(body)
+    });
+    if (!response.ok) {
+        const result = await response.json();
+        throw new Error(result.error || result.text || '请求失败');
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let done = null;
+    while (true) {
+        const { value, done: finished } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !finished });
+        const lines = buffer.split('\n');
+        buffer = lines.pop(); // 最后一段可能不完整，留到下次处理
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            const event = JSON.parse(line);
+            if (event.type === 'done') done = event;
+            onEvent(event);
+        }
+        if (finished) break;
+    }
+    return done;
+}
+
 // 异步函数：发送消息
 async function sendMessage() {
     const userMessage = chatInput.value.trim(); // 获取用户输入
@@ -116,36 +178,45 @@ async function sendMessage() {
             chatContainer.appendChild(fileDisplayContainer);
         }
 
-        // 发送文本和文件元数据到/ask，包含deep_search标志
-        const response = await fetch('/ask', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                text: userMessage,
-                files: uploadedFiles,
-                page_type: 'learning', // 指定页面类型为learning
-                deep_search: isDeepSearch // 传递深度搜索标志
-            })
-        });
-        const result = await response.json();
-
-        // 显示后端响应
+        const requestBody = {
+            text: userMessage,
+            files: uploadedFiles,
+            page_type: 'learning', // 指定页面类型为learning
+            deep_search: isDeepSearch // 传递深度搜索标志
+        };
         const responseDiv = document.createElement('div');
         responseDiv.className = 'message response';
-        responseDiv.innerHTML = marked.parse(result.text); // 渲染Markdown
-        if (result.files && result.files.length > 0) {
-            const fileDisplayContainer = document.createElement('div');
-            fileDisplayContainer.className = 'file-preview-container';
-            fileDisplayContainer.style.marginTop = '5px';
-            result.files.forEach(fileInfo => {
-                const fileDisplay = createFileDisplay(fileInfo, true); // 后端响应中图片直接展示
-                fileDisplayContainer.appendChild(fileDisplay);
+
+        if (uploadedFiles.length > 0) {
+            // 有图像时使用流式接口，每张图像分析完成后立即显示其结果
+            chatContainer.appendChild(responseDiv);
+            const partial = [];
+            const result = await askStream(requestBody, event => {
+                if (event.type === 'image') {
+                    const names = event.files.map(fileInfo => fileInfo.original_name).join('、');
+                    partial.push(`**${names}**：\n\n${event.text}`);
+                    responseDiv.innerHTML = marked.parse(partial.join('\n\n'));
+                    chatContainer.scrollTop = chatContainer.scrollHeight;
+                }
+            });
+            if (result) {
+                renderResponse(responseDiv, result); // 全部完成后按原格式显示合并结果
+            }
+        } else {
+            // 发送文本和文件元数据到/ask，包含deep_search标志
+            const response = await fetch('/ask', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(requestBody)
             });
-            responseDiv.appendChild(fileDisplayContainer);
+            const result = await response.json();
+
+            // 显示后端响应
+            renderResponse(responseDiv, result);
+            chatContainer.appendChild(responseDiv);
         }
-        chatContainer.appendChild(responseDiv);
 
         // 清空输入和文件
         chatInput.value = '';
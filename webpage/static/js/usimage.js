@@ -35,6 +35,17 @@ function createFileDisplay(fileInfo, isImagePreview = false) {
     return fileDisplay;
 }
 
+// 创建语音播放器：音频由/tts边合成边流式返回，浏览器收到数据后即开始播放
+function createAudioPlayer(audioUrl) {
+    const audio = document.createElement('audio');
+    audio.src = audioUrl;
+    audio.controls = true; // 浏览器阻止自动播放时可手动播放
+    audio.autoplay = true;
+    audio.style.display = 'block';
+    audio.style.marginTop = '5px';
+    return audio;
+}
+
 // 异步函数：上传文件到服务器
 async function uploadFiles(files) {
     const formData = new FormData(); // 创建FormData对象
@@ -103,6 +114,9 @@ async function sendImage() {
             });
             responseDiv.appendChild(fileDisplayContainer);
         }
+        if (result.audio_url) {
+            responseDiv.appendChild(createAudioPlayer(result.audio_url));
+        }
         interactionContainer.appendChild(responseDiv);
         // 清空选择的文件
         selectedFile = null;
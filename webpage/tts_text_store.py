@@ -0,0 +1,72 @@
+import hashlib
+import os
+import re
+import time
+from typing import Optional
+
+
+class TTSTextStore:
+    """保存待朗读的文本，供浏览器通过 /tts/<id> 获取音频
+
+    文本较长，直接放在 URL 中会超出代理和服务器的长度限制，这里按内容哈希保存为文件，URL 只携带短 id。
+    文件保存在本机目录中，多个工作进程共享；超过 ttl_seconds 未使用的文本在写入时顺带清理。
+
+    Args:
+        folder: 保存目录
+        ttl_seconds: 文本的有效期
+        cleanup_interval: 两次清理之间的最短间隔(秒)
+    """
+
+    ID_PATTERN = re.compile(r'^[0-9a-f]{24}$')
+
+    def __init__(self, folder: str, ttl_seconds: int = 3600, cleanup_interval: int = 300):
+        self.folder = folder
+        self.ttl_seconds = ttl_seconds
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0.0
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, text_id: str) -> str:
+        return os.path.join(self.folder, text_id + '.txt')
+
+    def put(self, text: str) -> str:
+        """保存文本并返回其 id，相同文本得到相同的 id"""
+        text_id = hashlib.sha256(text.encode('utf-8')).hexdigest()[:24]
+        path = self._path(text_id)
+        if os.path.exists(path):
+            os.utime(path)  # 刷新有效期
+        else:
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        if time.time() - self._last_cleanup >= self.cleanup_interval:
+            self.cleanup()
+        return text_id
+
+    def get(self, text_id: str) -> Optional[str]:
+        """返回文本，id 无效或已过期时返回 None"""
+        if not self.ID_PATTERN.match(text_id):
+            return None
+        path = self._path(text_id)
+        try:
+            if time.time() - os.path.getmtime(path) >= self.ttl_seconds:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def cleanup(self, now: Optional[float] = None) -> int:
+        """删除过期的文本，返回删除的数量"""
+        now = now or time.time()
+        self._last_cleanup = now
+        removed = 0
+        for entry in os.scandir(self.folder):
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime >= self.ttl_seconds:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass  # 其他进程已删除
+        return removed
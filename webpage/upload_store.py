@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from werkzeug.utils import secure_filename
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只有单进程部署, 线程锁即可
+    fcntl = None
+
+
+class UploadStore:
+    """按内容哈希保存上传文件，相同内容只存一份
+
+    引用索引记录每个文件被哪些会话使用，后台 GC 删除无引用或过期的文件。
+    索引中含会话ID（默认为客户端地址）和全部文件名，不能放在静态目录中被直接访问。
+
+    多进程部署时各工作进程共用同一个索引文件：每次修改都在文件锁内重新读取索引再写回，
+    GC 也基于完整的索引进行。GC 线程只在调用 start_gc 的进程中运行(fork 出的子进程不会重新启动)，
+    并通过非阻塞文件锁保证同一时间只有一个进程执行清理。
+
+    Args:
+        upload_folder: 上传目录（static/uploads）
+        quota_bytes: 上传目录容量配额，仅用于统计和告警
+        ttl_seconds: 会话引用的有效期，超过后视为不再使用
+        index_path: 引用索引文件路径，须位于静态目录之外
+    """
+
+    LEGACY_INDEX_NAME = '.refs.json'  # 旧版本保存在上传目录中的索引
+
+    def __init__(self, upload_folder: str, quota_bytes: int, ttl_seconds: int, index_path: str,
+                 chunk_size: int = 64 * 1024):
+        self.upload_folder = upload_folder
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self.chunk_size = chunk_size
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._index_stamp = None  # 最近读写时索引文件的 (mtime, size), 未变化时不重新读取
+        self._gc_thread = None
+        self._gc_lock_file = None
+        # 文件名 -> {'size': 字节数, 'created': 时间戳, 'sessions': {会话ID: 最近使用时间}}
+        self.refs: Dict[str, Dict[str, Any]] = {}
+        os.makedirs(upload_folder, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self._migrate_legacy_index()
+        self._load_index()
+        if hasattr(os, 'register_at_fork'):  # Windows 不支持 fork
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # GC 继续只在父进程中运行; 关闭继承的 GC 锁文件描述符(不解锁), 父进程仍持有锁
+        self._lock = threading.Lock()
+        self._gc_thread = None
+        if self._gc_lock_file is not None:
+            self._gc_lock_file.close()
+            self._gc_lock_file = None
+
+    def _migrate_legacy_index(self):
+        legacy_path = os.path.join(self.upload_folder, self.LEGACY_INDEX_NAME)
+        if not os.path.exists(legacy_path):
+            return
+        if not os.path.exists(self.index_path):
+            os.replace(legacy_path, self.index_path)
+        else:
+            os.remove(legacy_path)
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.index_path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def _load_index(self):
+        stamp = self._stamp()
+        if stamp is None:
+            self.refs = {}
+        elif stamp != self._index_stamp:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self.refs = json.load(f)
+            except Exception as e:
+                print(f'读取上传索引失败: {e}')
+                self.refs = {}
+        self._index_stamp = stamp
+
+    def _save_index(self):
+        # 调用方需持有 _locked()
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.refs, f)
+        os.replace(tmp_path, self.index_path)
+        self._index_stamp = self._stamp()
+
+    @contextmanager
+    def _locked(self):
+        """持有线程锁和索引文件锁，并读入其他进程对索引的修改"""
+        with self._lock:
+            if fcntl is None:
+                self._load_index()
+                yield
+                return
+            with open(self.index_path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._load_index()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self, file, session_id: str) -> str:
+        """边写入磁盘边计算哈希，返回保存后的文件名"""
+        extension = os.path.splitext(secure_filename(file.filename))[1].lower()
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.upload_folder, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = file.stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            filename = digest.hexdigest()[:32] + extension
+            with self._locked():
+                path = os.path.join(self.upload_folder, filename)
+                if os.path.exists(path):
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, path)
+                entry = self.refs.setdefault(filename, {'size': size, 'created': time.time(), 'sessions': {}})
+                entry['sessions'][session_id] = time.time()
+                self._save_index()
+                total = self._referenced_bytes()
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self.quota_bytes and total > self.quota_bytes:
+            print(f"上传目录超出配额: {total} / {self.quota_bytes} 字节")
+        return filename
+
+    def _referenced_bytes(self) -> int:
+        # 调用方需持有锁; 按索引记录的大小累计, 不扫描目录
+        return sum(entry['size'] for entry in self.refs.values())
+
+    def touch(self, filename: str, session_id: str):
+        """会话再次使用某个文件时刷新引用时间"""
+        with self._locked():
+            entry = self.refs.get(filename)
+            if entry is not None:
+                entry['sessions'][session_id] = time.time()
+                self._save_index()
+
+    def gc(self, now: Optional[float] = None) -> Dict[str, int]:
+        """删除无引用或引用已过期的文件，以及索引之外的过期旧文件"""
+        now = now or time.time()
+        removed, freed = 0, 0
+        with self._locked():
+            for filename in list(self.refs):
+                entry = self.refs[filename]
+                entry['sessions'] = {sid: ts for sid, ts in entry['sessions'].items()
+                                     if now - ts < self.ttl_seconds}
+                if not entry['sessions']:
+                    path = os.path.join(self.upload_folder, filename)
+                    if os.path.exists(path):
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                    del self.refs[filename]
+                    removed += 1
+            # 迁移前以 UUID 命名保存的文件没有引用记录，按修改时间过期
+            for filename in os.listdir(self.upload_folder):
+                path = os.path.join(self.upload_folder, filename)
+                if filename in self.refs or not os.path.isfile(path):
+                    continue
+                # 其他进程正在写入的 .part 文件修改时间是新的, 不会被删除
+                if now - os.path.getmtime(path) >= self.ttl_seconds:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+            self._save_index()
+        return {'removed': removed, 'freed_bytes': freed}
+
+    def _acquire_gc_leader(self) -> bool:
+        """取得 GC 锁的进程负责清理，持有到进程退出；其他进程每轮重试，持有者退出后接替"""
+        if fcntl is None or self._gc_lock_file is not None:
+            return True
+        lock_file = open(self.index_path + '.gc.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._gc_lock_file = lock_file
+        return True
+
+    def start_gc(self, interval: int = 600):
+        """启动后台 GC 线程"""
+        if self._gc_thread is not None and self._gc_thread.is_alive():
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    if not self._acquire_gc_leader():
+                        continue
+                    result = self.gc()
+                    if result['removed']:
+                        print(f"上传目录清理: 删除 {result['removed']} 个文件, 释放 {result['freed_bytes']} 字节")
+                except Exception as e:
+                    print(f'上传目录清理失败: {e}')
+
+        self._gc_thread = threading.Thread(target=loop, name='upload-gc', daemon=True)
+        self._gc_thread.start()
+
+    def usage(self) -> Dict[str, Any]:
+        """上传目录容量指标，按引用索引统计，不含尚未被 GC 清理的旧文件"""
+        with self._locked():
+            total, files = self._referenced_bytes(), len(self.refs)
+        return {
+            'files': files,
+            'bytes': total,
+            'quota_bytes': self.quota_bytes,
+            'quota_ratio': total / self.quota_bytes if self.quota_bytes else 0,
+        }